@@ -0,0 +1,160 @@
+import argparse
+import logging
+import math
+import os
+import sys
+import time
+from multiprocessing.util import Finalize
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import chess
+import chess.engine
+import chess.pgn
+
+from ChessGeneric import ENGINE_PATH, LOG_LEVEL, TIME_PROFILES, describe_engine_options, get_engine_options, get_move_limit, load_engine
+
+# Plays engine-vs-engine games between the menu's skill levels without a window, spread over a
+# process pool with one Stockfish per worker process. Finished games are appended to a PGN file
+# as they come in, and the score is summed up as win/draw/loss plus an Elo difference estimate.
+#
+# Example: python ChessBatch.py --skills 1 8 --games 200 --pgn games/easy_vs_medium.pgn
+
+# --- Constants ---
+DEFAULT_GAMES = 100
+DEFAULT_PGN_PATH = os.path.join(os.path.dirname(__file__), "games", "batch.pgn")
+MAX_PLIES = 400  # Games still running after this many plies are adjudicated as draws
+
+logger = logging.getLogger("ChessBatch")
+
+# --- Worker Process State ---
+worker_engine = None # Stockfish for this worker process, started by init_worker
+
+def init_worker(engine_path, engine_options):
+    global worker_engine
+    worker_engine = load_engine(engine_path)
+    if worker_engine is None:
+        raise RuntimeError(f"Could not start engine at {engine_path}")
+    # Threads/Hash once per worker; only the skill level changes between moves
+    worker_engine.configure({name: value for name, value in engine_options.items() if name not in ("MultiPV", "Skill Level")})
+    # atexit does not run in pool workers; without this the engine's thread keeps the worker alive
+    Finalize(worker_engine, worker_engine.quit, exitpriority=10)
+
+def play_game(game_number, white_skill, black_skill, move_time, max_plies):
+    # Runs in a worker process. Returns (game number, white skill, black skill, result, PGN text).
+    board = chess.Board()
+    skills = {chess.WHITE: white_skill, chess.BLACK: black_skill}
+    while not board.is_game_over(claim_draw=True) and board.ply() < max_plies:
+        skill = skills[board.turn]
+        if move_time is None:
+            limit = get_move_limit(board, skill) # Same per-move limits as the interactive game
+        else:
+            limit = chess.engine.Limit(time=move_time)
+        worker_engine.configure({"Skill Level": skill})
+        result = worker_engine.play(board, limit, game=game_number) # New game id -> ucinewgame
+        if result.move is None:
+            break # Resigned; scored as a draw below unless the board says otherwise
+        board.push(result.move)
+
+    outcome = board.outcome(claim_draw=True)
+    result = outcome.result() if outcome else "1/2-1/2"
+    game = chess.pgn.Game.from_board(board)
+    game.headers["Event"] = "Engine batch"
+    game.headers["Round"] = str(game_number)
+    game.headers["White"] = f"Stockfish skill {white_skill}"
+    game.headers["Black"] = f"Stockfish skill {black_skill}"
+    game.headers["Result"] = result
+    if move_time is not None:
+        game.headers["TimeControl"] = f"{move_time}s/move"
+    if outcome is None:
+        game.headers["Termination"] = "adjudication"
+    return game_number, white_skill, black_skill, result, str(game)
+
+# --- Scoring ---
+def elo_difference(wins, draws, losses):
+    # Elo difference implied by the score, with a 95% margin; None where it is unbounded (0% / 100%)
+    games = wins + draws + losses
+    if games == 0:
+        return None, None
+    score = (wins + draws / 2) / games
+    if score <= 0 or score >= 1:
+        return None, None
+    deviation = math.sqrt((wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games)
+    margin = 1.96 * deviation / math.sqrt(games)
+
+    def to_elo(p):
+        p = min(max(p, 1e-6), 1 - 1e-6)
+        return 400 * math.log10(p / (1 - p))
+
+    return to_elo(score), (to_elo(score + margin) - to_elo(score - margin)) / 2
+
+def print_summary(skill_a, skill_b, wins, draws, losses, errors, elapsed):
+    games = wins + draws + losses
+    print(f"Skill {skill_a} vs skill {skill_b}: +{wins} ={draws} -{losses} ({games} games, {elapsed:.1f}s)")
+    if errors:
+        print(f"{errors} games failed with an error and are not counted")
+    elo, margin = elo_difference(wins, draws, losses)
+    if elo is None:
+        print("Elo difference: not measurable yet (needs at least one non-win and one non-loss)")
+    else:
+        print(f"Elo difference: {elo:+.1f} +/- {margin:.1f} (skill {skill_a} relative to skill {skill_b})")
+
+# --- Batch Runner ---
+def run_batch(skill_a, skill_b, games, move_time, pgn_path, workers, engine_path, max_plies):
+    os.makedirs(os.path.dirname(os.path.abspath(pgn_path)), exist_ok=True)
+    wins = draws = losses = 0 # From skill_a's point of view
+    errors = 0 # Games that failed (e.g. the engine crashed); not scored
+    # The stronger side's profile, with the machine's cores and memory split between all workers
+    engine_options = get_engine_options(max(skill_a, skill_b), workers)
+    print(f"{workers} workers, engine threads/hash per worker: {describe_engine_options(engine_options)}")
+    start_time = time.time()
+    with open(pgn_path, "a") as pgn_file, ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(engine_path, engine_options)) as pool:
+        futures = {} # future -> (game number, white skill, black skill, True if side A plays white)
+        for game_number in range(1, games + 1):
+            # Alternate colours so neither side profits from always having the first move
+            a_is_white = game_number % 2 == 1
+            white, black = (skill_a, skill_b) if a_is_white else (skill_b, skill_a)
+            futures[pool.submit(play_game, game_number, white, black, move_time, max_plies)] = (game_number, white, black, a_is_white)
+
+        for finished, future in enumerate(as_completed(futures), 1):
+            # Scored by the colour side A had, which also works when both sides have the same skill
+            game_number, white, black, a_is_white = futures[future]
+            try:
+                _, _, _, result, pgn_text = future.result()
+            except Exception as e:
+                errors += 1
+                logger.error("Game %s failed: %s", game_number, e)
+                print(f"[{finished}/{games}] Game {game_number}: skill {white} vs skill {black} error  (+{wins} ={draws} -{losses})")
+                continue
+            pgn_file.write(pgn_text + "\n\n")
+            pgn_file.flush() # Finished games are on disk even if the batch is interrupted
+            if result == "1/2-1/2":
+                draws += 1
+            elif (result == "1-0") == a_is_white:
+                wins += 1
+            else:
+                losses += 1
+            print(f"[{finished}/{games}] Game {game_number}: skill {white} vs skill {black} {result}  (+{wins} ={draws} -{losses})")
+
+    print_summary(skill_a, skill_b, wins, draws, losses, errors, time.time() - start_time)
+    return wins, draws, losses
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play engine-vs-engine games between skill levels in parallel.")
+    parser.add_argument("--skills", type=int, nargs=2, metavar=("A", "B"), default=(1, 8), help="skill levels to pit against each other (menu presets: %s)" % ", ".join(map(str, TIME_PROFILES)))
+    parser.add_argument("--games", type=int, default=DEFAULT_GAMES, help="number of games to play")
+    parser.add_argument("--move-time", type=float, default=None, help="seconds per move (default: the game's per-skill time profiles)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes, each with its own engine (default: all cores)")
+    parser.add_argument("--pgn", default=DEFAULT_PGN_PATH, help="PGN file finished games are appended to")
+    parser.add_argument("--engine", default=ENGINE_PATH, help="path to the UCI engine")
+    parser.add_argument("--max-plies", type=int, default=MAX_PLIES, help="adjudicate a draw after this many plies")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(message)s")
+
+    if not os.path.exists(args.engine):
+        print(f"Error: engine not found at {args.engine}")
+        return 1
+    run_batch(args.skills[0], args.skills[1], args.games, args.move_time, args.pgn, args.workers, args.engine, args.max_plies)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
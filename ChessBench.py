@@ -0,0 +1,256 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from collections import OrderedDict
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy") # Headless: no window, the screen is an off-screen surface
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+import chess
+
+import ChessGeneric
+from ChessGeneric import ENGINE_PATH, GameSession, Profiler, get_playing_layout
+
+# Replays fixed positions and a scripted click sequence through the game's own code paths
+# (handle_board_click, draw_playing_screen with draw_board/highlight_squares/draw_pieces,
+# build_move_index and make_engine_move) without a window, and compares the timings with a
+# saved baseline. Exits with status 1 if anything got slower than the tolerance allows.
+#
+# Example: python ChessBench.py --save-baseline   (on a known good build)
+#          python ChessBench.py                   (on the new build, same box)
+
+# --- Constants ---
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(__file__), "bench", "baseline.json")
+DEFAULT_TOLERANCE = 0.15 # Share a metric may get worse before it counts as a regression
+FRAME_REPEATS = 20 # Full redraws per position
+CLICK_REPEATS = 10 # Times the click script is replayed
+MOVE_INDEX_REPEATS = 500 # build_move_index calls per position
+# Positions every benchmark runs over; White to move and more than one legal move in each
+FEN_SUITE = [
+    ("start", chess.STARTING_FEN),
+    ("italian", "r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4"),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"),
+    ("promotions", "n1n5/PPPk4/8/8/8/8/4Kppp/5N1N w - - 0 1"),
+    ("rook_endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1"),
+]
+# From the start position: player clicks, then the opponent's reply. Includes the clicks that
+# don't move anything (opponent's piece, deselect, reselect, empty square).
+CLICK_SCRIPT = [
+    ("e2 e4", "e7e5"),
+    ("a7 g1 g1 g1 f3", "b8c6"),
+    ("e2 f1 c4", "g8f6"),
+    ("d2 h5 d2 d4", "e5d4"),
+    ("e1 g1", "f8e7"),
+    ("f3 d4", "c6d4"),
+    ("d1 d4", "d7d6"),
+    ("c1 g5", "c8e6"),
+    ("c4 e6", "f7e6"),
+]
+HIGHER_IS_BETTER = ("fps",) # Metric name suffixes where a drop is the regression
+
+# --- Setup ---
+def disable_engine_shortcuts():
+    # Book, tablebase and position cache answer from local files, so the timings would depend
+    # on the box and on earlier runs. The bench times the search (sessions also don't ponder).
+    ChessGeneric.opening_book_checked = True # Never opened -> no book moves
+    ChessGeneric.tablebase_checked = True
+    ChessGeneric.position_cache = OrderedDict()
+
+def set_position(session, fen):
+    session.board = chess.Board(fen)
+    session.build_move_index()
+    session.selected_square = None
+    session.is_player_move = True
+
+def draw_frame(session, layout, full):
+    if full:
+        ChessGeneric.mark_full_redraw()
+    dirty_rects = ChessGeneric.draw_playing_screen(ChessGeneric.screen, session, *layout)
+    if dirty_rects is None:
+        pygame.display.flip()
+    elif dirty_rects:
+        pygame.display.update(dirty_rects)
+
+# --- Benchmarks ---
+# Each one records into ChessGeneric.profiler; draw_playing_screen adds its draw_* spans itself.
+def bench_render(session, layout):
+    profiler = ChessGeneric.profiler
+    for name, fen in FEN_SUITE:
+        set_position(session, fen)
+        # Selecting every piece that can move covers highlight_squares as well
+        selectable = [chess.square_name(square) for square in session.legal_moves_from]
+        for i in range(FRAME_REPEATS):
+            session.selected_square = selectable[i % len(selectable)]
+            start = time.perf_counter()
+            draw_frame(session, layout, full=True)
+            profiler.record("full_frame", start)
+
+def bench_clicks(session, layout):
+    profiler = ChessGeneric.profiler
+    for _ in range(CLICK_REPEATS):
+        session.restart_game()
+        draw_frame(session, layout, full=True)
+        for clicks, reply in CLICK_SCRIPT:
+            for square_name in clicks.split():
+                start = time.perf_counter()
+                session.handle_board_click(square_name)
+                profiler.record("handle_board_click", start)
+                frame_start = time.perf_counter()
+                draw_frame(session, layout, full=False) # Dirty rects, as after a click in the game
+                profiler.record("click_frame", frame_start)
+            if session.is_player_move:
+                raise RuntimeError(f"Click script out of sync: '{clicks}' made no move")
+            session.push_move(chess.Move.from_uci(reply))
+            session.is_player_move = True
+            draw_frame(session, layout, full=False)
+
+def bench_move_index(session):
+    profiler = ChessGeneric.profiler
+    for name, fen in FEN_SUITE:
+        session.board = chess.Board(fen)
+        for _ in range(MOVE_INDEX_REPEATS):
+            start = time.perf_counter()
+            session.build_move_index()
+            profiler.record("build_move_index", start)
+            session.position_counts.clear() # Repeats must not turn into a fivefold repetition
+
+def bench_engine(engine, skills, depths):
+    profiler = ChessGeneric.profiler
+    for skill in skills:
+        session = GameSession(engine=engine, engine_difficulty=skill, ponder=False)
+        try:
+            for name, fen in FEN_SUITE:
+                session.restart_game() # New game id -> ucinewgame, clean clock
+                set_position(session, fen)
+                session.is_player_move = False
+                start = time.perf_counter()
+                if not session.wait_for_engine_move(timeout=60):
+                    raise RuntimeError(f"Engine did not move within 60s (skill {skill}, {name})")
+                profiler.record(f"engine_skill_{skill}", start)
+                depths.setdefault(skill, []).append(session.last_engine_info.get("depth", 0))
+                ChessGeneric.position_cache.clear() # The next run must search this position again
+                ChessGeneric.position_cache_dirty = False
+        finally:
+            session.close()
+
+def run_benchmarks(engine_path, skills):
+    ChessGeneric.init_display()
+    ChessGeneric.load_piece_images()
+    ChessGeneric.load_and_scale_images(ChessGeneric.INITIAL_SQUARE_SIZE)
+    disable_engine_shortcuts()
+    layout = get_playing_layout()
+    session = GameSession()
+
+    # One untimed pass first so sprite scaling, text rendering and caches are warm
+    bench_render(session, layout)
+    bench_clicks(session, layout)
+    profiler = ChessGeneric.profiler = Profiler(max_samples=100000, max_trace=0)
+    profiler.set_enabled(True)
+    bench_render(session, layout)
+    bench_clicks(session, layout)
+    bench_move_index(session)
+
+    depths = {}
+    if skills:
+        engine = ChessGeneric.load_engine(engine_path)
+        if engine is None:
+            raise RuntimeError(f"Could not start engine at {engine_path}")
+        try:
+            bench_engine(engine, skills, depths)
+        finally:
+            engine.quit()
+    session.close()
+    pygame.quit()
+
+    metrics = {}
+    for name, stats in sorted(profiler.summary().items()):
+        if name == "engine_move":
+            continue # All skill levels mixed together; the engine_skill_* spans split them up
+        for stat in ("p50_ms", "p95_ms", "mean_ms"):
+            metrics[f"{name}.{stat}"] = round(stats[stat], 4)
+    metrics["full_frame.fps"] = round(1000 / metrics["full_frame.mean_ms"], 1)
+    metrics["click_frame.fps"] = round(1000 / metrics["click_frame.mean_ms"], 1)
+    for skill, skill_depths in depths.items():
+        metrics[f"engine_skill_{skill}.depth"] = round(sum(skill_depths) / len(skill_depths), 1)
+    return metrics
+
+# --- Baseline ---
+def get_environment():
+    return {
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "python-chess": chess.__version__,
+        "machine": platform.machine(),
+        "system": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+def save_results(path, metrics):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"created": time.strftime("%Y-%m-%d %H:%M:%S"), "environment": get_environment(), "metrics": metrics}, f, indent=1)
+
+def compare(metrics, baseline, tolerance):
+    # Prints every metric next to the baseline; returns the names that regressed
+    regressions = []
+    print(f"{'metric':<34}{'current':>12}{'baseline':>12}{'change':>10}")
+    for name, value in metrics.items():
+        base = baseline.get(name)
+        if base is None or name.endswith(".depth"):
+            change = "" if base is None else f"{value - base:+.1f}"
+            print(f"{name:<34}{value:>12}{'-' if base is None else base:>12}{change:>10}")
+            continue
+        change = (value - base) / base if base else 0.0
+        worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+        flag = "  REGRESSION" if worse > tolerance else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<34}{value:>12}{base:>12}{change:>+10.1%}{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless rendering, input and engine latency benchmarks, compared with a saved baseline.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="baseline results file")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline instead of comparing")
+    parser.add_argument("--output", help="also write this run's results to this file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="share a metric may get worse before it fails the run (default: %(default)s)")
+    parser.add_argument("--skills", type=int, nargs="*", default=list(ChessGeneric.TIME_PROFILES), help="skill levels to time the engine at (none: skip the engine)")
+    parser.add_argument("--engine", default=ENGINE_PATH, help="path to the UCI engine")
+    parser.add_argument("--log-level", default="WARNING", help="log level of the game code while benchmarking")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.skills and not os.path.exists(args.engine):
+        print(f"Error: engine not found at {args.engine} (use --skills with no levels to skip the engine)")
+        return 1
+    start_time = time.time()
+    metrics = run_benchmarks(args.engine, args.skills)
+    print(f"Benchmarks finished in {time.time() - start_time:.1f}s")
+    if args.output:
+        save_results(args.output, metrics)
+
+    if args.save_baseline:
+        save_results(args.baseline, metrics)
+        for name, value in metrics.items():
+            print(f"{name:<34}{value:>12}")
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["metrics"]
+    except FileNotFoundError:
+        baseline = {}
+        print(f"No baseline at {args.baseline} yet; run with --save-baseline to create one.")
+    regressions = compare(metrics, baseline, args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
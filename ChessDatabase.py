@@ -0,0 +1,389 @@
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import time
+from array import array
+
+import chess
+import chess.pgn
+import chess.polyglot
+
+# Local game database. PGN files are read one game at a time and stored in SQLite: the
+# headers plus the moves in a compact binary encoding (2 bytes per move), and an index from
+# the Zobrist hash of every position to the games that reached it. Move statistics (games,
+# white wins, draws, black wins per move played) are kept pre-aggregated for the positions a
+# game reaches in its first STATS_MAX_PLY plies, so the opening tree answers from a single
+# index range however many games there are. Games that only reach a position later on (a
+# transposition, or any deeper position) are added from the position index.
+#
+# Example: python ChessDatabase.py ingest games/archive.pgn
+#          python ChessDatabase.py stats "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+#          python ChessDatabase.py search "<fen>"
+
+# --- Constants ---
+DATABASE_PATH = os.path.join(os.path.dirname(__file__), "games", "games.db")
+STATS_MAX_PLY = 30 # Positions a game reaches before this ply go into the pre-aggregated statistics
+INGEST_BATCH_GAMES = 1000 # Games per transaction while ingesting
+RESULT_CODES = {"1-0": 1, "1/2-1/2": 0, "0-1": -1} # Anything else (e.g. "*") is stored as NULL
+
+logger = logging.getLogger("ChessDatabase")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    event TEXT, date TEXT, white TEXT, black TEXT,
+    result INTEGER, -- RESULT_CODES value, NULL if unknown
+    fen TEXT, -- Start position if not the standard one
+    moves BLOB -- encode_moves()
+);
+CREATE TABLE IF NOT EXISTS positions (
+    hash INTEGER, game_id INTEGER, ply INTEGER,
+    next_move INTEGER, -- Move played from here, NULL at the end of the game
+    PRIMARY KEY (hash, game_id, ply)
+) WITHOUT ROWID;
+-- Occurrences the statistics tables do not cover, found without walking the whole hash range
+CREATE INDEX IF NOT EXISTS late_positions ON positions (hash) WHERE ply >= {max_ply};
+CREATE TABLE IF NOT EXISTS move_stats (
+    hash INTEGER, move INTEGER,
+    games INTEGER, white_wins INTEGER, draws INTEGER, black_wins INTEGER, -- Each game counted once
+    PRIMARY KEY (hash, move)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS position_stats (
+    hash INTEGER PRIMARY KEY,
+    games INTEGER -- Games that reached the position before STATS_MAX_PLY
+);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    offset INTEGER -- Bytes of the file already ingested
+);
+""".format(max_ply=STATS_MAX_PLY)
+
+# --- Encoding ---
+def encode_move(move):
+    # from square | to square << 6 | promotion piece type << 12
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+def decode_move(code):
+    return chess.Move(code & 63, code >> 6 & 63, code >> 12 or None)
+
+def encode_moves(moves):
+    return array("H", map(encode_move, moves)).tobytes()
+
+def decode_moves(data):
+    codes = array("H")
+    codes.frombytes(data)
+    return [decode_move(code) for code in codes]
+
+def to_signed(key):
+    # 64-bit hash as a signed integer, the range SQLite stores
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+def position_key(board):
+    return to_signed(chess.polyglot.zobrist_hash(board))
+
+# --- Incremental Hashing ---
+# Hashing a whole board is about half the time of ingesting a game, so while reading PGN the
+# piece part of the Polyglot hash is updated only for the squares each move changes; the
+# keys are the same as position_key()'s.
+ZOBRIST_HASHER = chess.polyglot.ZobristHasher(chess.polyglot.POLYGLOT_RANDOM_ARRAY)
+
+def piece_hash(piece, square):
+    if piece is None:
+        return 0
+    return chess.polyglot.POLYGLOT_RANDOM_ARRAY[64 * ((piece.piece_type - 1) * 2 + piece.color) + square]
+
+def get_changed_squares(board, move):
+    # Squares whose piece changes when the move is played on the board
+    if board.is_castling(move):
+        return chess.SquareSet(chess.BB_RANK_1 if board.turn == chess.WHITE else chess.BB_RANK_8) # Covers Chess960 too
+    if board.is_en_passant(move):
+        return (move.from_square, move.to_square, chess.square(chess.square_file(move.to_square), chess.square_rank(move.from_square)))
+    return (move.from_square, move.to_square)
+
+# --- PGN Reading ---
+class ByteCountingReader:
+    # Lines of a PGN file opened in binary mode, for read_game(), counting the bytes read so far.
+    # (tell() on a text file is an opaque cookie, not a byte offset.)
+    def __init__(self, raw, offset):
+        self.raw = raw
+        self.offset = offset
+        self.line = None # Last line read; "" at the end of the file
+
+    def readline(self):
+        data = self.raw.readline()
+        self.offset += len(data)
+        self.line = data.decode("utf-8", errors="replace") # Lines split at b"\n" never split a UTF-8 character
+        return self.line
+
+class IndexingVisitor(chess.pgn.BaseVisitor):
+    """Collects headers, mainline moves and position keys of one game; variations are skipped.
+
+    result() is (headers, start FEN or None, moves, keys of every position), or False if the
+    game could not be read (read_game() itself returns None at the end of the file).
+    """
+
+    def begin_game(self):
+        self.headers = None
+        self.moves = []
+        self.keys = []
+        self.board = None
+        self.replaced = None
+        self.failed = False
+        self.terminated = False # Result token seen: the game is complete even without a blank line after it
+
+    def begin_headers(self):
+        self.headers = chess.pgn.Headers()
+        return self.headers
+
+    def visit_header(self, tagname, tagvalue):
+        self.headers[tagname] = tagvalue
+
+    def end_headers(self):
+        if self.headers.get("Variant", "Standard").lower() not in ("standard", "chess", "chess960"):
+            self.failed = True
+            return chess.pgn.SKIP
+
+    def visit_board(self, board):
+        # Called with the start position and again after each move is pushed onto the same board
+        if self.board is None:
+            self.board = board
+            self.pieces_key = ZOBRIST_HASHER.hash_board(board)
+        elif self.replaced is None:
+            return # No move was pushed (it could not be parsed)
+        else:
+            for square, piece in self.replaced:
+                self.pieces_key ^= piece_hash(piece, square) ^ piece_hash(board.piece_at(square), square)
+        self.replaced = None
+        self.keys.append(to_signed(self.pieces_key ^ ZOBRIST_HASHER.hash_castling(board) ^ ZOBRIST_HASHER.hash_ep_square(board) ^ ZOBRIST_HASHER.hash_turn(board)))
+
+    def visit_move(self, board, move):
+        self.moves.append(move)
+        # (square, piece before the move) of the squares the move changes, re-hashed in visit_board
+        self.replaced = [(square, board.piece_at(square)) for square in get_changed_squares(board, move)]
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def visit_result(self, result):
+        self.terminated = True
+
+    def handle_error(self, error):
+        self.failed = True
+
+    def result(self):
+        if self.failed or self.board is None:
+            return False
+        fen = self.headers.get("FEN")
+        return self.headers, fen, self.moves, self.keys
+
+# --- Database ---
+# Occurrences of a position in games that did not reach it before STATS_MAX_PLY, i.e. the ones
+# missing from move_stats and position_stats. "ply >= <constant>" lets SQLite use the partial index.
+LATE_POSITIONS_QUERY = (
+    "SELECT {{}} FROM positions p WHERE p.hash = ? AND p.ply >= {max_ply} AND NOT EXISTS "
+    "(SELECT 1 FROM positions q WHERE q.hash = p.hash AND q.game_id = p.game_id AND q.ply < {max_ply})").format(max_ply=STATS_MAX_PLY)
+
+class GameDatabase:
+    def __init__(self, path=DATABASE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    # --- Ingest ---
+    def ingest_pgn(self, pgn_path, progress=None):
+        # Adds the games of a PGN file. Remembers the byte offset after the last complete game,
+        # so ingesting a file that has grown since (like the game's archive, which may be
+        # written to meanwhile) only adds the new games; a game still being written at the end
+        # of the file is left for next time. progress(games added so far) is called after every
+        # batch. Returns the games added.
+        pgn_path = os.path.abspath(pgn_path)
+        row = self.connection.execute("SELECT offset FROM sources WHERE path = ?", (pgn_path,)).fetchone()
+        offset = row[0] if row else 0
+        if offset > os.path.getsize(pgn_path):
+            offset = 0 # File was replaced by a shorter one
+        added = skipped = 0
+        stats = {} # (key, move) -> [games, white wins, draws, black wins] for this batch
+        self.connection.execute("PRAGMA synchronous=OFF") # Rebuildable from the PGN; speed matters more
+        with open(pgn_path, "rb") as raw:
+            raw.seek(offset)
+            handle = ByteCountingReader(raw, offset) # read_game strips a byte order mark itself
+            visitor = IndexingVisitor()
+            batch = 0
+            while True:
+                parsed = chess.pgn.read_game(handle, Visitor=lambda: visitor)
+                if parsed is None:
+                    break # End of file
+                if handle.line == "" and not (parsed and visitor.terminated):
+                    break # Ran into the end of the file in the middle of a game
+                offset = handle.offset # read_game stops at the blank line after a game
+                if parsed is False:
+                    skipped += 1
+                    continue # Illegal moves or another variant; read_game already moved past it
+                self.add_game(*parsed, stats)
+                added += 1
+                batch += 1
+                if batch >= INGEST_BATCH_GAMES:
+                    self.commit_batch(pgn_path, offset, stats)
+                    batch = 0
+                    if progress:
+                        progress(added)
+            self.commit_batch(pgn_path, offset, stats)
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        if skipped:
+            logger.warning("%s: %s games could not be read and were skipped.", pgn_path, skipped)
+        return added
+
+    def add_game(self, headers, fen, moves, keys, stats):
+        result = RESULT_CODES.get(headers.get("Result"))
+        cursor = self.connection.execute(
+            "INSERT INTO games (event, date, white, black, result, fen, moves) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (headers.get("Event"), headers.get("Date"), headers.get("White"), headers.get("Black"), result, fen, encode_moves(moves)))
+        game_id = cursor.lastrowid
+        codes = [encode_move(move) for move in moves] + [None]
+        self.connection.executemany("INSERT OR IGNORE INTO positions (hash, game_id, ply, next_move) VALUES (?, ?, ?, ?)",
+                                    [(key, game_id, ply, code) for ply, (key, code) in enumerate(zip(keys, codes))])
+        # A game that repeats a position is counted once for it (and once per move played from it);
+        # (key, None) entries count the games through the position
+        early = set(zip(keys[:STATS_MAX_PLY], codes[:STATS_MAX_PLY]))
+        early.update((key, None) for key in keys[:STATS_MAX_PLY])
+        for key, code in early:
+            counts = stats.get((key, code))
+            if counts is None:
+                counts = stats[(key, code)] = [0, 0, 0, 0]
+            counts[0] += 1
+            if result is not None:
+                counts[2 - result] += 1 # 1 -> white wins, 0 -> draws, -1 -> black wins
+
+    def commit_batch(self, pgn_path, offset, stats):
+        self.connection.executemany(
+            "INSERT INTO move_stats (hash, move, games, white_wins, draws, black_wins) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (hash, move) DO UPDATE SET games = games + excluded.games, white_wins = white_wins + excluded.white_wins, "
+            "draws = draws + excluded.draws, black_wins = black_wins + excluded.black_wins",
+            [(key, code, *counts) for (key, code), counts in stats.items() if code is not None])
+        self.connection.executemany(
+            "INSERT INTO position_stats (hash, games) VALUES (?, ?) ON CONFLICT (hash) DO UPDATE SET games = games + excluded.games",
+            [(key, counts[0]) for (key, code), counts in stats.items() if code is None])
+        stats.clear()
+        self.connection.execute("INSERT OR REPLACE INTO sources (path, offset) VALUES (?, ?)", (pgn_path, offset))
+        self.connection.commit()
+
+    # --- Queries ---
+    def game_count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM games").fetchone()[0]
+
+    def move_stats(self, board):
+        # [(move, games, white wins, draws, black wins)] of the moves played from this position, most played first
+        key = position_key(board)
+        totals = {} # move code -> [games, white wins, draws, black wins]
+        for code, *counts in self.connection.execute(
+                "SELECT move, games, white_wins, draws, black_wins FROM move_stats WHERE hash = ?", (key,)):
+            totals[code] = counts
+        # Plus the games that only got here after STATS_MAX_PLY, once per move they played from here
+        for code, *counts in self.connection.execute(
+                "SELECT late.next_move, COUNT(*), CAST(TOTAL(g.result = 1) AS INTEGER), CAST(TOTAL(g.result = 0) AS INTEGER), "
+                "CAST(TOTAL(g.result = -1) AS INTEGER) FROM (" + LATE_POSITIONS_QUERY.format("DISTINCT p.game_id, p.next_move") + ") late "
+                "JOIN games g ON g.id = late.game_id WHERE late.next_move IS NOT NULL GROUP BY late.next_move", (key,)):
+            totals[code] = [total + count for total, count in zip(totals.get(code, (0, 0, 0, 0)), counts)]
+        stats = []
+        for code, counts in sorted(totals.items(), key=lambda item: -item[1][0]):
+            move = decode_move(code)
+            if move in board.legal_moves: # Drops the odd hash collision
+                stats.append((move, *counts))
+        return stats
+
+    def count_games_through(self, board):
+        key = position_key(board)
+        early = self.connection.execute("SELECT games FROM position_stats WHERE hash = ?", (key,)).fetchone()
+        late = self.connection.execute(LATE_POSITIONS_QUERY.format("COUNT(DISTINCT p.game_id)"), (key,)).fetchone()
+        return (early[0] if early else 0) + late[0]
+
+    def games_through(self, board, limit=20):
+        # Newest games that reached this position: [(game id, white, black, result, date, ply)]
+        rows = self.connection.execute(
+            "SELECT g.id, g.white, g.black, g.result, g.date, MIN(p.ply) FROM positions p JOIN games g ON g.id = p.game_id "
+            "WHERE p.hash = ? GROUP BY p.game_id ORDER BY p.game_id DESC LIMIT ?", (position_key(board), limit))
+        results = {code: text for text, code in RESULT_CODES.items()}
+        return [(game_id, white, black, results.get(result, "*"), date, ply) for game_id, white, black, result, date, ply in rows]
+
+    def get_game(self, game_id):
+        # The stored game as a chess.pgn.Game, or None
+        row = self.connection.execute("SELECT event, date, white, black, result, fen, moves FROM games WHERE id = ?", (game_id,)).fetchone()
+        if row is None:
+            return None
+        event, date, white, black, result, fen, moves = row
+        game = chess.pgn.Game()
+        if fen:
+            game.setup(fen)
+        node = game
+        for move in decode_moves(moves):
+            node = node.add_main_variation(move)
+        results = {code: text for text, code in RESULT_CODES.items()}
+        for name, value in (("Event", event), ("Date", date), ("White", white), ("Black", black), ("Result", results.get(result, "*"))):
+            if value is not None:
+                game.headers[name] = value
+        return game
+
+def format_stats_row(board, move, games, white, draws, black):
+    return f"{board.san(move):<8}{games:>8}   {white * 100 // games:>3}% / {draws * 100 // games:>3}% / {black * 100 // games:>3}%"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local game database: ingest PGN files and search it by position.")
+    parser.add_argument("--database", default=DATABASE_PATH, help="database file (default: games/games.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="add the games of PGN files (files seen before only add their new games)")
+    ingest.add_argument("pgn", nargs="+")
+    stats = commands.add_parser("stats", help="moves played from a position with their results")
+    stats.add_argument("fen", nargs="?", default=chess.STARTING_FEN)
+    search = commands.add_parser("search", help="games that reached a position")
+    search.add_argument("fen")
+    search.add_argument("--limit", type=int, default=20)
+    show = commands.add_parser("show", help="print a stored game as PGN")
+    show.add_argument("game_id", type=int)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    database = GameDatabase(args.database)
+    try:
+        if args.command == "ingest":
+            for pgn_path in args.pgn:
+                start_time = time.time()
+                added = database.ingest_pgn(pgn_path, progress=lambda count: print(f"  {count} games...", end="\r"))
+                print(f"{pgn_path}: {added} games added in {time.time() - start_time:.1f}s ({database.game_count()} in the database)")
+            return 0
+        try:
+            board = chess.Board(args.fen) if args.command != "show" else None
+        except ValueError as e:
+            print(f"Error: invalid FEN: {e}")
+            return 1
+        start_time = time.perf_counter()
+        if args.command == "stats":
+            rows = database.move_stats(board)
+            total = database.count_games_through(board)
+            print(f"{total} games through this position ({(time.perf_counter() - start_time) * 1000:.1f} ms)")
+            print(f"{'move':<8}{'games':>8}   white / draws / black")
+            for row in rows:
+                print(format_stats_row(board, *row))
+        elif args.command == "search":
+            rows = database.games_through(board, args.limit)
+            print(f"{len(rows)} games shown ({(time.perf_counter() - start_time) * 1000:.1f} ms)")
+            for game_id, white, black, result, date, ply in rows:
+                print(f"#{game_id:<8} {white} - {black}  {result}  {date}  (move {ply // 2 + 1})")
+        elif args.command == "show":
+            game = database.get_game(args.game_id)
+            if game is None:
+                print(f"Error: no game {args.game_id}")
+                return 1
+            print(game)
+        return 0
+    finally:
+        database.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
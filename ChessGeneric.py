@@ -1,13 +1,24 @@
 import pygame
 import chess
 import chess.engine
+import chess.pgn
+import chess.polyglot
+import chess.syzygy
 import sys
 import os
 import time
-
-# --- Pygame Initialization ---
-pygame.init()
-print("Pygame initialized.")
+import threading
+import queue
+import json
+import itertools
+import math
+import logging
+import contextlib
+import csv
+import sqlite3
+from collections import OrderedDict, deque
+
+from ChessDatabase import DATABASE_PATH, GameDatabase
 
 # --- Constants ---
 INITIAL_SQUARE_SIZE = 80
@@ -18,6 +29,7 @@ MENU_BUTTON_WIDTH = 150 # Width for menu buttons
 MENU_BUTTON_HEIGHT = 50 # Height for menu buttons
 BUTTON_MARGIN = 15
 FPS = 30
+IDLE_WAIT_MS = 500  # Max time to block waiting for input when nothing on screen is changing
 LIGHT_SQUARE = (238, 238, 210)
 DARK_SQUARE = (118, 150, 86)
 HIGHLIGHT_COLOR = (255, 255, 0, 150)
@@ -33,76 +45,357 @@ MIN_BOARD_SIZE = 400  # Minimum size to prevent extreme shrinking
 PROMOTION_CHOICE = ['q', 'r', 'n', 'b']
 PROMOTION_PANEL_HEIGHT = 50
 PROMOTION_BUTTON_WIDTH = 60
-ANIMATION_DURATION = 0.3  # Seconds for piece movement animation
+ANIMATION_DURATION = 0.3  # Seconds for piece movement animation (captured pieces fade out over the same time)
+ENGINE_MOVE_TIME = 1.0  # Seconds the engine searches per move when no time profile applies
+# Skill level -> (base seconds per move, max depth, max nodes); None means no limit
+TIME_PROFILES = {1: (0.2, 6, 50000), 8: (0.5, 12, 500000), 15: (0.8, None, None), 20: (1.0, None, None)}
+PHASE_TIME_FACTORS = {'opening': 0.5, 'middlegame': 1.0, 'endgame': 0.7}  # Share of the base time per game phase
+ENGINE_GAME_TIME = 300  # Seconds on the engine's clock for a whole game (None = no clock)
+CLOCK_MOVES_TO_GO = 20  # Never spend more than this fraction of the remaining clock on one move
+MIN_MOVE_TIME = 0.05  # Seconds; lower bound for any search
+TEXT_CACHE_SIZE = 128  # Rendered text surfaces kept around (least recently used dropped first)
+PONDER_ENABLED = True  # Let the engine think on the player's time about the expected reply
+PONDER_MIN_SKILL = 15  # Easy/Medium stop at a few thousand nodes anyway; pondering gains them nothing
+PONDER_MAX_TIME = 30.0  # Seconds; a ponder search ends on its own after this even if the player never moves
+OPENING_BOOK_PATH = os.path.join(os.path.dirname(__file__), "books", "book.bin")  # Optional Polyglot book
+OPENING_BOOK_PLIES = {1: 8, 8: 16, 15: 24, 20: 30}  # Skill level -> plies the book is used for (0 = off)
+POSITION_CACHE_PATH = os.path.join(os.path.dirname(__file__), "cache", "positions.json")  # Engine moves seen before
+POSITION_CACHE_SIZE = 50000  # Max positions kept; least recently used ones are dropped first
+JOURNAL_PATH = os.path.join(os.path.dirname(__file__), "games", "journal.log")  # Moves of the game in progress
+PGN_ARCHIVE_PATH = os.path.join(os.path.dirname(__file__), "games", "archive.pgn")  # Every finished game
+JOURNAL_SYNC_INTERVAL = 1.0  # Seconds; journal writes are batched and fsynced at most this often
+SYZYGY_PATH = os.path.join(os.path.dirname(__file__), "syzygy")  # Optional Syzygy tablebase directory
+SYZYGY_PIECES = {1: 0, 8: 4, 15: 5, 20: 7}  # Skill level -> max pieces on the board for tablebase moves (0 = off)
+SYZYGY_MAX_OPEN_FILES = 64  # Tablebase files kept open at once (least recently used closed first)
+ENGINE_POOL_SIZE = 4  # Max engine processes kept running for concurrent game sessions
+ANALYSIS_PANEL_HEIGHT = 90  # Analysis lines below the info panel
+ANALYSIS_MULTIPV = 3  # Lines shown in the analysis panel
+ANALYSIS_PV_MOVES = 8  # Moves of each line shown
+ANALYSIS_REFRESH_INTERVAL = 0.1  # Seconds; the analysis panel is redrawn at most this often
+# Skill level -> (share of CPU cores, share of free memory for Hash, max Hash MB, MultiPV, Move Overhead ms).
+# Shares are split between the engines running at the same time; None means no cap.
+ENGINE_PROFILES = {1: (0.0, 0.0, 16, 1, 10), 8: (0.25, 0.05, 256, 1, 20), 15: (0.5, 0.15, 1024, 1, 30), 20: (1.0, 0.5, None, 1, 50)}
+MIN_HASH_MB = 16  # Stockfish's default
+FALLBACK_FREE_MEMORY_MB = 1024  # Assumed free memory where it can't be measured
+try:
+    # Programs running engines on this machine at the same time (e.g. 2 copies of the game, or the
+    # game next to ChessServer); every engine's Threads and Hash shares are divided by it
+    MACHINE_INSTANCES = max(1, int(os.environ.get("CHESS_INSTANCES", "1")))
+except ValueError:
+    MACHINE_INSTANCES = 1
+# Adjust the relative path to your Stockfish executable
+ENGINE_PATH = os.environ.get("STOCKFISH_PATH", os.path.join(os.path.dirname(__file__), "stockfish", "stockfish-generic")) #replace with real stockfish path (or set STOCKFISH_PATH)
+# For different OS or paths, adjust ENGINE_PATH accordingly
+# Example for Linux: os.path.join(os.path.dirname(__file__), "stockfish", "stockfish")
+# Example for specific user path (like your original):
+# "C:\\Users\\blake\\Documents\\ChessApp\\stockfish\\stockfish-windows-x86-64-avx2.exe"
+
+LOG_LEVEL = os.environ.get("CHESS_LOG_LEVEL", "INFO")  # DEBUG shows every click and animation
+PROFILE_ON_START = bool(os.environ.get("CHESS_PROFILE"))  # Start with the profiler overlay on
+PROFILER_KEY = pygame.K_F3  # Toggles the profiler overlay (and metric collection)
+PROFILE_EXPORT_KEY = pygame.K_F4  # Writes the collected metrics to PROFILE_TRACE_PATH (.json and .csv)
+PROFILE_TRACE_PATH = os.path.join(os.path.dirname(__file__), "profile", "trace")
+PROFILE_SAMPLES = 300  # Samples per span kept for the percentiles (about 10 s of frames at FPS)
+PROFILE_TRACE_SIZE = 100000  # Span records kept for export (oldest dropped first)
+PROFILER_REFRESH_INTERVAL = 0.25  # Seconds between overlay redraws
+SIMUL_BOARDS = 4  # Games shown at once in the simultaneous exhibition
+SIMUL_SKILL = 8  # Engine skill level on every simul board
+SIMUL_ENGINES = 2  # Engine processes shared by all simul boards; each one works through its boards' searches in turn
+SIMUL_LABEL_HEIGHT = 24  # Status line under each simul board
+ENGINE_STATUS_EVENT = pygame.USEREVENT + 1  # Posted when the engine started in the background is ready (or failed)
+ENGINE_LEASE_EVENT = pygame.USEREVENT + 2  # Posted when engines leased in the background are ready (workers=[], if none could be had)
+DATABASE_QUERY_EVENT = pygame.USEREVENT + 3  # Posted when the database browser's lookup of a position is done
+DATABASE_SQUARE_SIZE = 70  # Board in the database browser; leaves room for the move statistics beside it
+DATABASE_ROW_HEIGHT = 26  # Rows of the move statistics and the game list
+DATABASE_GAMES_SHOWN = 12  # Newest games through the position listed under the board
+
+logger = logging.getLogger("ChessGeneric")
 
 # --- Game States ---
 MENU = 0
 PLAYING = 1
 GAME_OVER = 2 # We might implicitly handle this via game_over_text, but state is cleaner
-animating = False
-animation_start_time = 0
-animation_piece = None
-animation_start_pos = None
-animation_end_pos = None
-last_player_move = None # Store the last player move for visual feedback
-print("Game state variables initialized.")
+SIMUL = 3 # Several boards against the engine at once
+DATABASE = 4 # Browsing the game database
+tweens = [] # Running Tween objects; the move animation is everything in here
 
 # --- Pygame Setup ---
-# Initial screen size - might be adjusted by menu later
-fixed_size = 1024
-screen = pygame.display.set_mode((fixed_size, fixed_size))
-screen_width, screen_height = fixed_size, fixed_size # Update width and height
-pygame.display.set_caption("Dragonex Technologies Chess")
-clock = pygame.time.Clock()
-font = pygame.font.Font(None, FONT_SIZE)
-info_font = pygame.font.Font(None, INFO_FONT_SIZE)
-promotion_font = pygame.font.Font(None, 24)
-menu_title_font = pygame.font.Font(None, MENU_TITLE_FONT_SIZE)
-menu_button_font = pygame.font.Font(None, MENU_BUTTON_FONT_SIZE)
-print("Pygame setup complete (screen, clock, fonts).")
+# Nothing touches the display until init_display() is called from the game's main block,
+# so the module can be imported (and GameSession used) without opening a window.
+screen = None
+screen_width, screen_height = 0, 0
+clock = None
+font = None
+info_font = None
+promotion_font = None
+menu_title_font = None
+menu_button_font = None
+
+def init_display():
+    global screen, screen_width, screen_height, clock, font, info_font, promotion_font, menu_title_font, menu_button_font
+    pygame.init()
+    logger.info("Pygame initialized.")
+    # Initial screen size - might be adjusted by menu later
+    fixed_size = 1024
+    screen = pygame.display.set_mode((fixed_size, fixed_size))
+    screen_width, screen_height = fixed_size, fixed_size # Update width and height
+    pygame.display.set_caption("Dragonex Technologies Chess")
+    clock = pygame.time.Clock()
+    font = pygame.font.Font(None, FONT_SIZE)
+    info_font = pygame.font.Font(None, INFO_FONT_SIZE)
+    promotion_font = pygame.font.Font(None, 24)
+    menu_title_font = pygame.font.Font(None, MENU_TITLE_FONT_SIZE)
+    menu_button_font = pygame.font.Font(None, MENU_BUTTON_FONT_SIZE)
+    logger.info("Pygame setup complete (screen, clock, fonts).")
 
 # --- Load Images ---
 piece_images_raw = {}
 pieces = ['p', 'r', 'n', 'b', 'q', 'k']
 colors = ['w', 'b']
-print("Loading piece images...")
 # Assuming 'assets' folder is in the same directory as the script
 assets_path = os.path.join(os.path.dirname(__file__), "assets")
-for color in colors:
-    for piece in pieces:
-        filename = os.path.join(assets_path, f"{color}{piece}.png")
-        try:
-            piece_images_raw[color + piece] = pygame.image.load(filename).convert_alpha()
-            print(f"Loaded image: {filename}")
-        except FileNotFoundError:
-            print(f"Error: Could not load image: {filename}")
-            print("Make sure you have an 'assets' folder with PNG chess piece images (e.g., wp.png, bb.png) in the same directory as the script.")
-            pygame.quit()
-            sys.exit()
-print("Piece images loaded.")
-
-piece_images = {}  # Will store scaled images
+# All 12 pieces in one file (a row per color, in the order above): one read instead of twelve.
+# Rebuilt from the single images when missing; delete it after changing any of them.
+piece_atlas_path = os.path.join(assets_path, "pieces_atlas.png")
+
+def load_piece_atlas():
+    try:
+        atlas = pygame.image.load(piece_atlas_path).convert_alpha()
+    except (pygame.error, FileNotFoundError) as e:
+        logger.debug("No piece atlas (%s), loading single images.", e)
+        return False
+    tile_size = atlas.get_height() // len(colors)
+    if atlas.get_width() != tile_size * len(pieces):
+        logger.warning("Piece atlas %s has the wrong size, loading single images.", piece_atlas_path)
+        return False
+    for row, color in enumerate(colors):
+        for col, piece in enumerate(pieces):
+            piece_images_raw[color + piece] = atlas.subsurface((col * tile_size, row * tile_size, tile_size, tile_size))
+    return True
+
+def save_piece_atlas():
+    tile_size = max(image.get_height() for image in piece_images_raw.values())
+    atlas = pygame.Surface((tile_size * len(pieces), tile_size * len(colors)), pygame.SRCALPHA)
+    for row, color in enumerate(colors):
+        for col, piece in enumerate(pieces):
+            image = piece_images_raw[color + piece]
+            if image.get_size() != (tile_size, tile_size):
+                image = pygame.transform.smoothscale(image, (tile_size, tile_size))
+            atlas.blit(image, (col * tile_size, row * tile_size))
+    try:
+        pygame.image.save(atlas, piece_atlas_path)
+        logger.info("Piece atlas written to %s.", piece_atlas_path)
+    except (pygame.error, OSError) as e:
+        logger.warning("Could not write piece atlas %s: %s", piece_atlas_path, e) # Read-only install; fine
+
+def load_piece_images():
+    logger.info("Loading piece images...")
+    if load_piece_atlas():
+        logger.info("Piece images loaded from %s.", piece_atlas_path)
+        return
+    for color in colors:
+        for piece in pieces:
+            filename = os.path.join(assets_path, f"{color}{piece}.png")
+            try:
+                piece_images_raw[color + piece] = pygame.image.load(filename).convert_alpha()
+                logger.debug("Loaded image: %s", filename)
+            except FileNotFoundError:
+                logger.error("Could not load image: %s", filename)
+                logger.warning("Make sure you have an 'assets' folder with PNG chess piece images (e.g., wp.png, bb.png) in the same directory as the script.")
+                pygame.quit()
+                sys.exit()
+    logger.info("Piece images loaded.")
+    save_piece_atlas()
+
+piece_images = {}  # Will store scaled images for the current board size
+
+# --- Sprite Cache ---
+# Scaled piece images keyed by (piece key, (width, height)). Scaling is done once per size
+# instead of on every frame; sizes that are no longer in use get evicted.
+PROMOTION_SPRITE_SIZE = (PROMOTION_BUTTON_WIDTH - 10, PROMOTION_PANEL_HEIGHT - 10)
+sprite_cache = {}
+active_sprite_sizes = set()
+
+def get_piece_sprite(key, size):
+    sprite = sprite_cache.get((key, size))
+    if sprite is None:
+        if not piece_images_raw:
+            load_piece_images() # Loaded on first use, so nothing is read from disk before the menu is up
+        sprite = pygame.transform.scale(piece_images_raw[key], size)
+        sprite_cache[(key, size)] = sprite
+    return sprite
 
 def load_and_scale_images(square_size):
+    if not piece_images_raw:
+        load_piece_images()
+    square_sprite_size = (square_size, square_size)
+    active_sprite_sizes.clear()
+    active_sprite_sizes.update((square_sprite_size, PROMOTION_SPRITE_SIZE))
+    # Evict sprites scaled for sizes that are no longer used (e.g. after a resize)
+    for cache_key in [k for k in sprite_cache if k[1] not in active_sprite_sizes]:
+        del sprite_cache[cache_key]
     piece_images.clear()
-    for key, img in piece_images_raw.items():
-        piece_images[key] = pygame.transform.scale(img, (square_size, square_size))
-
-# --- Game State Variables ---
-board = chess.Board()
-selected_square = None
-possible_moves = []
-engine = None
-engine_process = None
-# player_turn = True # Player is always White, starts True
-# Let's rename to make it clearer:
-is_player_move = True # True if it's the human player's turn (White)
-promotion_move = None  # Stores the move that resulted in promotion
+    for key in piece_images_raw:
+        piece_images[key] = get_piece_sprite(key, square_sprite_size)
+        get_piece_sprite(key, PROMOTION_SPRITE_SIZE)
+    logger.debug("Sprite cache built for square size %s (%s sprites).", square_size, len(sprite_cache))
+
+# --- Render Cache ---
+board_layer = None # Square pattern, baked once per square size
+selection_overlay = None # Translucent square for the selected piece
+move_overlay = None # Dot marking a legal destination
+button_cache = {} # (text, size, color, text color, font) -> pre-rendered button surface
+text_cache = OrderedDict() # (font, text, color) -> rendered text surface, in LRU order
+
+def render_text(font, text, color):
+    # font.render() rasterises the glyphs every call; static labels only need it once
+    cache_key = (font, text, color)
+    text_surface = text_cache.get(cache_key)
+    if text_surface is None:
+        text_surface = font.render(text, True, color)
+        text_cache[cache_key] = text_surface
+        if len(text_cache) > TEXT_CACHE_SIZE:
+            text_cache.popitem(last=False)
+    else:
+        text_cache.move_to_end(cache_key)
+    return text_surface
+
+# --- Instrumentation ---
+class _Span:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, self.start)
+        return False
+
+def percentile(ordered, pct):
+    # Nearest-rank percentile of an already sorted, non-empty list
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+NULL_SPAN = contextlib.nullcontext() # Returned by span() while profiling is off
+
+class Profiler:
+    """Named timing spans, kept in bounded windows per name for the overlay's percentiles.
+
+    Off by default: span() then hands back a shared no-op context manager and record()
+    returns straight away. While on, every span is also added to a bounded trace that
+    export() writes out as JSON (summary + trace) and CSV (trace).
+    """
+
+    def __init__(self, max_samples=PROFILE_SAMPLES, max_trace=PROFILE_TRACE_SIZE):
+        self.enabled = False
+        self.max_samples = max_samples
+        self.samples = {} # span name -> deque of durations in seconds
+        self.trace = deque(maxlen=max_trace) # (span name, start offset, duration)
+        self.frame_times = deque(maxlen=max_samples) # perf_counter() of every drawn frame
+        self.start_time = time.perf_counter()
+
+    def set_enabled(self, enabled):
+        if enabled and not self.enabled:
+            self.samples.clear()
+            self.trace.clear()
+            self.frame_times.clear()
+            self.start_time = time.perf_counter()
+        self.enabled = enabled
+
+    def span(self, name):
+        return _Span(self, name) if self.enabled else NULL_SPAN
+
+    def record(self, name, start, duration=None):
+        # Duration defaults to the time since `start` (a perf_counter() value)
+        if not self.enabled:
+            return
+        if duration is None:
+            duration = time.perf_counter() - start
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = deque(maxlen=self.max_samples)
+        samples.append(duration)
+        self.trace.append((name, start - self.start_time, duration))
+
+    def mark_frame(self):
+        if self.enabled:
+            self.frame_times.append(time.perf_counter())
+
+    def fps(self):
+        if len(self.frame_times) < 2:
+            return 0.0
+        now = time.perf_counter()
+        recent = [t for t in self.frame_times if now - t <= 1.0]
+        return float(len(recent))
+
+    def percentile(self, name, pct):
+        samples = self.samples.get(name)
+        if not samples:
+            return None
+        return percentile(sorted(samples), pct)
+
+    def summary(self):
+        # span name -> count and timings in milliseconds
+        result = {}
+        for name, samples in self.samples.items():
+            if samples:
+                result[name] = {
+                    "count": len(samples),
+                    "mean_ms": sum(samples) / len(samples) * 1000,
+                    "p50_ms": self.percentile(name, 50) * 1000,
+                    "p95_ms": self.percentile(name, 95) * 1000,
+                    "p99_ms": self.percentile(name, 99) * 1000,
+                    "max_ms": max(samples) * 1000,
+                }
+        return result
+
+    def export(self, path=PROFILE_TRACE_PATH):
+        # Writes path.json and path.csv; returns False if they could not be written
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".json", "w") as f:
+                json.dump({"fps": self.fps(), "summary": self.summary(),
+                           "trace": [{"name": name, "start": start, "duration": duration} for name, start, duration in self.trace]}, f, indent=1)
+            with open(path + ".csv", "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["name", "start_s", "duration_ms"])
+                for name, start, duration in self.trace:
+                    writer.writerow([name, f"{start:.6f}", f"{duration * 1000:.4f}"])
+            logger.info("Profile written to %s.json / .csv (%s spans).", path, len(self.trace))
+            return True
+        except OSError as e:
+            logger.error("Error writing profile %s: %s", path, e)
+            return False
+
+profiler = Profiler()
+
+# --- Shared Engine State ---
+engine_pool = None # EnginePool, created when the game starts
+opening_book = None # Polyglot reader, opened on first use
+opening_book_checked = False
+tablebase = None # Syzygy tables, opened on first use
+tablebase_checked = False
+tablebase_max_pieces = 0 # Most pieces covered by the tables found
+position_cache = None # OrderedDict in LRU order, loaded from disk on first use
+position_cache_dirty = False # True if there are entries not yet written to disk
+position_cache_writer = None # Thread writing the cache in the background, while it runs
+game_journal = None # GameJournal of the interactive game, created when the game starts
+resumed_game = None # (skill, moves) of an unfinished game found in the journal at startup
+
+# --- UI State Variables ---
+session = None # GameSession being shown; created when a difficulty is picked
+analysis = None # LiveAnalysis while analysis mode is on
 game_state = MENU # Start in the menu
-engine_difficulty = None # Will be set by the menu (e.g., skill level 1, 10, 20)
-game_over_text = None
 menu_buttons = {} # To store menu button rects and associated difficulty levels
-print("Game state variables initialized.")
+engine_request = None # What the engines being leased in the background are for, e.g. ("game", 8)
+simul_sessions = [] # GameSession per simul board
+simul_workers = [] # Engine workers leased for the simul, shared by its boards
+simul_drawn = {} # Simul board index -> (ply, selected square, status) as currently shown
+database_browser = None # DatabaseBrowser, created the first time it is shown and kept between visits
 
 # --- Functions ---
 def get_square_from_pos(pos, square_size, board_origin):
@@ -127,100 +420,142 @@ def get_pos_from_square(square_name, square_size, board_origin):
     row = 7 - chess.square_rank(square_index) # Invert row for drawing
     return board_x + col * square_size, board_y + row * square_size
 
-def draw_board(surface, square_size):
-    board_size = 8 * square_size
+def get_square_rect(square_index, square_size):
+    # Rect of a square relative to the board's top-left corner
+    col = chess.square_file(square_index)
+    row = 7 - chess.square_rank(square_index) # Invert row for drawing
+    return pygame.Rect(col * square_size, row * square_size, square_size, square_size)
+
+def get_squares_in_rect(rect, square_size):
+    # All squares a board-relative rect overlaps (used to repaint under a moving piece)
+    board_rect = pygame.Rect(0, 0, 8 * square_size, 8 * square_size)
+    rect = rect.clip(board_rect)
+    if rect.width == 0 or rect.height == 0:
+        return []
+    squares = []
+    for col in range(rect.left // square_size, (rect.right - 1) // square_size + 1):
+        for row in range(rect.top // square_size, (rect.bottom - 1) // square_size + 1):
+            squares.append(chess.square(col, 7 - row))
+    return squares
+
+def build_board_layer(square_size):
+    # Bake the static square pattern and the highlight overlays once per square size
+    global board_layer, selection_overlay, move_overlay
+    board_layer = pygame.Surface((8 * square_size, 8 * square_size)).convert()
     for row in range(8):
         for col in range(8):
             color = LIGHT_SQUARE if (row + col) % 2 == 0 else DARK_SQUARE
-            pygame.draw.rect(surface, color, (col * square_size, row * square_size, square_size, square_size))
-
-def draw_pieces(surface, board, square_size, animating, animation_piece, animation_start_pos, animation_end_pos):
-     for square in chess.SQUARES:
+            pygame.draw.rect(board_layer, color, (col * square_size, row * square_size, square_size, square_size))
+
+    selection_overlay = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
+    pygame.draw.rect(selection_overlay, HIGHLIGHT_COLOR, (0, 0, square_size, square_size))
+
+    move_overlay = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
+    radius = square_size // 4 # Make the circle smaller
+    # Draw a circle indicator for legal moves
+    pygame.draw.circle(move_overlay, (0, 0, 0, 80), (square_size // 2, square_size // 2), radius)
+
+def draw_board(surface, square_size, squares=chess.SQUARES):
+    if board_layer is None or board_layer.get_width() != 8 * square_size:
+        build_board_layer(square_size)
+    for square in squares:
+        square_rect = get_square_rect(square, square_size)
+        surface.blit(board_layer, square_rect, square_rect)
+
+def get_piece_key(piece):
+    color_char = 'w' if piece.color == chess.WHITE else 'b'
+    return color_char + piece.symbol().lower()
+
+def draw_pieces(surface, board, square_size, hidden_squares=(), squares=chess.SQUARES):
+     for square in squares:
+         if square in hidden_squares:
+             continue # A tween is moving the piece onto this square; drawn by draw_tweens
          piece = board.piece_at(square)
          if piece:
-             color_char = 'w' if piece.color == chess.WHITE else 'b'
-             symbol_char = piece.symbol().lower()
-             key = color_char + symbol_char
-             # Calculate position relative to the surface we are drawing on (the board_surface)
-             col = chess.square_file(square)
-             row = 7 - chess.square_rank(square)  # Invert row for drawing
-             pos = (col * square_size, row * square_size)
-
-             if animating and chess.square_name(square) == animation_piece:
-                 # Draw the animating piece at its current interpolated position
-                 fraction = (time.time() - animation_start_time) / ANIMATION_DURATION
-                 if 0 <= fraction <= 1:
-                     x = animation_start_pos[0] + (animation_end_pos[0] - animation_start_pos[0]) * fraction
-                     y = animation_start_pos[1] + (animation_end_pos[1] - animation_start_pos[1]) * fraction
-                     if key in piece_images_raw:  # Use raw images for scaling on the fly
-                         scaled_image = pygame.transform.scale(piece_images_raw[key], (square_size, square_size))
-                         surface.blit(scaled_image, (x, y))
-                 # If animation is over, it will be reset in the game loop
-             else:
-                 if key in piece_images_raw:  # Use raw images for scaling on the fly
-                     scaled_image = pygame.transform.scale(piece_images_raw[key], (square_size, square_size))
-                     surface.blit(scaled_image, pos)
-                 else:
-                     print(f"Warning: Missing image key {key}")  # Should not happen
-
-def highlight_squares(surface, square_size):
-    if selected_square:
-        # Calculate position relative to the surface (board_surface)
-        square_index = chess.parse_square(selected_square)
-        col = chess.square_file(square_index)
-        row = 7 - chess.square_rank(square_index)
-        s_pos = (col * square_size, row * square_size)
-
-        highlight_surface = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
-        pygame.draw.rect(highlight_surface, HIGHLIGHT_COLOR, (0, 0, square_size, square_size))
-        surface.blit(highlight_surface, s_pos)
-
-        for move in possible_moves:
-            # Ensure the move starts from the selected square before highlighting destination
-            if move.from_square == square_index:
-                to_col = chess.square_file(move.to_square)
-                to_row = 7 - chess.square_rank(move.to_square)
-                to_pos = (to_col * square_size, to_row * square_size)
-                highlight_surface_move = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
-                center_x = square_size // 2
-                center_y = square_size // 2
-                radius = square_size // 4 # Make the circle smaller
-                # Draw a circle indicator for legal moves
-                pygame.draw.circle(highlight_surface_move, (0, 0, 0, 80), (center_x, center_y), radius)
-                surface.blit(highlight_surface_move, to_pos)
-
-
-def draw_info_panel(surface, text, turn_is_white, panel_rect, panel_rect2, last_move):
+             surface.blit(get_piece_sprite(get_piece_key(piece), (square_size, square_size)), get_square_rect(square, square_size))
+
+def draw_tweens(surface, square_size, now):
+    for tween in tweens:
+        sprite = get_piece_sprite(get_piece_key(tween.piece), (square_size, square_size))
+        alpha = tween.alpha(now)
+        if alpha < 255:
+            faded = sprite.copy() # The sprite is shared through the cache; its own alpha is left alone
+            faded.set_alpha(alpha)
+            surface.blit(faded, tween.pos(now))
+        else:
+            surface.blit(sprite, tween.pos(now))
+
+
+def get_highlights(session):
+    # square -> overlay for the current selection and its legal destinations
+    highlights = {}
+    if session.selected_square:
+        square_index = chess.parse_square(session.selected_square)
+        for to_square in chess.SquareSet(session.legal_destinations.get(square_index, 0)):
+            highlights[to_square] = 'move'
+        highlights[square_index] = 'selected'
+    return highlights
+
+def highlight_squares(surface, square_size, highlights, squares=chess.SQUARES):
+    for square in squares:
+        kind = highlights.get(square)
+        if kind == 'selected':
+            surface.blit(selection_overlay, get_square_rect(square, square_size))
+        elif kind == 'move':
+            surface.blit(move_overlay, get_square_rect(square, square_size))
+
+def draw_info_panel(surface, text, turn_is_white, panel_rect, panel_rect2, last_move, known_result=None):
      pygame.draw.rect(surface, (220, 220, 220), panel_rect)
 
      # Determine whose turn it is based on board state
      turn_str = f"Turn: {'White (You)' if turn_is_white else 'Black (AI)'}"
-     turn_text = info_font.render(turn_str, True, (0, 0, 0))
+     turn_text = render_text(info_font, turn_str, (0, 0, 0))
      turn_rect = turn_text.get_rect(centery=panel_rect.centery, left=panel_rect.left + 10)
      surface.blit(turn_text, turn_rect)
 
      # Display last move
      if last_move:
-         last_move_text = info_font.render(f"Last Move: {last_move.uci()}", True, (0, 0, 0))
+         last_move_text = render_text(info_font, f"Last Move: {last_move.uci()}", (0, 0, 0))
          last_move_rect = last_move_text.get_rect(centery=panel_rect.centery, centerx=panel_rect.centerx)
          surface.blit(last_move_text, last_move_rect)
 
+     # Display the tablebase verdict once the result is known
+     if known_result:
+         result_text = render_text(info_font, known_result, (0, 0, 150))
+         result_rect = result_text.get_rect(centery=panel_rect.centery, right=panel_rect.right - 10)
+         surface.blit(result_text, result_rect)
+
      # Display game over text if applicable
      if text:
-         info_text = info_font.render(text, True, (200, 0, 0))  # Red color for game over
+         info_text = render_text(info_font, text, (200, 0, 0))  # Red color for game over
          info_rect = info_text.get_rect(center=panel_rect2.center)
          surface.blit(info_text, info_rect)
 
 
 def create_button(surface, text, rect, color, text_color, font):
-    pygame.draw.rect(surface, color, rect, border_radius=5)
-    button_text = font.render(text, True, text_color)
-    text_rect = button_text.get_rect(center=rect.center)
-    surface.blit(button_text, text_rect)
+    # Button chrome and label are rendered once and reused from the cache afterwards
+    cache_key = (text, rect.size, color, text_color, font)
+    button_surface = button_cache.get(cache_key)
+    if button_surface is None:
+        button_surface = pygame.Surface(rect.size, pygame.SRCALPHA)
+        pygame.draw.rect(button_surface, color, button_surface.get_rect(), border_radius=5)
+        button_text = render_text(font, text, text_color)
+        text_rect = button_text.get_rect(center=button_surface.get_rect().center)
+        button_surface.blit(button_text, text_rect)
+        button_cache[cache_key] = button_surface
+    surface.blit(button_surface, rect)
     return rect # Return rect for potential hover/click detection outside this func
 
+def draw_analysis_panel(surface, panel_rect, header, lines):
+    pygame.draw.rect(surface, (235, 235, 235), panel_rect)
+    y = panel_rect.top + 4
+    for i, text in enumerate([header] + lines):
+        # Analysis text changes many times a second; rendered directly so it doesn't churn the text cache
+        text_surface = info_font.render(text, True, (0, 0, 120) if i == 0 else (0, 0, 0))
+        surface.blit(text_surface, (panel_rect.left + 10, y))
+        y += info_font.get_linesize()
+
 def draw_promotion_panel(surface, board_origin, square_size):
-    global promotion_move # Make sure we're using the global
     board_x, board_y = board_origin
     color_char = 'w' # Player is always white
     panel_width = len(PROMOTION_CHOICE) * PROMOTION_BUTTON_WIDTH
@@ -232,302 +567,1724 @@ def draw_promotion_panel(surface, board_origin, square_size):
     buttons_data = [] # Store rect and piece char
     for i, piece_char in enumerate(PROMOTION_CHOICE):
         piece_symbol = color_char + piece_char
-        img = pygame.transform.scale(piece_images_raw[piece_symbol], (PROMOTION_BUTTON_WIDTH - 10, PROMOTION_PANEL_HEIGHT - 10))
+        img = get_piece_sprite(piece_symbol, PROMOTION_SPRITE_SIZE)
         button_rect = pygame.Rect(panel_x + i * PROMOTION_BUTTON_WIDTH, panel_y, PROMOTION_BUTTON_WIDTH, PROMOTION_PANEL_HEIGHT)
         img_rect = img.get_rect(center=button_rect.center)
         surface.blit(img, img_rect)
         buttons_data.append({'rect': button_rect, 'piece': piece_char})
     return buttons_data
 
-def handle_promotion_click(pos, promotion_buttons_data):
-    global promotion_move, board, is_player_move, game_over_text # Declare globals needed
-
-    if not promotion_move: # Should not happen if called correctly, but safe check
-        print("Error: handle_promotion_click called without a pending promotion_move.")
-        return False
-
+def get_promotion_choice(pos, promotion_buttons_data):
     for button_data in promotion_buttons_data:
         if button_data['rect'].collidepoint(pos):
-            promotion_piece_char = button_data['piece']
-
-            # --- START CHANGE ---
-            # promotion_move now holds the base move (e.g., d7c8 squares)
-            base_uci = promotion_move.uci() # Get UCI like "d7c8"
-            final_uci = base_uci + promotion_piece_char # Append choice, e.g., "d7c8" + "q" -> "d7c8q"
-            print(f"Attempting promotion move: {final_uci}")
-
+            return button_data['piece']
+    return None # Click was not on a promotion button
+
+# --- Time Management ---
+def get_game_phase(board):
+    # Rough phase from the move number and the non-pawn material left on the board
+    material = 0
+    for piece_type, weight in ((chess.KNIGHT, 1), (chess.BISHOP, 1), (chess.ROOK, 2), (chess.QUEEN, 4)):
+        material += weight * len(board.pieces(piece_type, chess.WHITE) | board.pieces(piece_type, chess.BLACK))
+    if material <= 8:
+        return 'endgame'
+    if board.fullmove_number <= 10:
+        return 'opening'
+    return 'middlegame'
+
+def get_move_budget(board, skill, clock_remaining=None):
+    # Seconds to think about this move: the skill's base time scaled by game phase, capped by the clock
+    base_time = TIME_PROFILES.get(skill, (ENGINE_MOVE_TIME, None, None))[0]
+    budget = base_time * PHASE_TIME_FACTORS[get_game_phase(board)]
+    if clock_remaining is not None:
+        budget = min(budget, clock_remaining / CLOCK_MOVES_TO_GO)
+    return max(budget, MIN_MOVE_TIME)
+
+def get_move_limit(board, skill, clock_remaining=None):
+    _, max_depth, max_nodes = TIME_PROFILES.get(skill, (ENGINE_MOVE_TIME, None, None))
+    if max_nodes is not None:
+        max_nodes = int(max_nodes * PHASE_TIME_FACTORS[get_game_phase(board)])
+    return chess.engine.Limit(time=get_move_budget(board, skill, clock_remaining), depth=max_depth, nodes=max_nodes)
+
+# --- Engine Options ---
+def get_free_memory_mb():
+    # Memory the OS can hand out right now, in MB (None if it can't be measured here)
+    try:
+        with open("/proc/meminfo") as f: # Linux: includes reclaimable page cache
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None # e.g. Windows
+
+def get_engine_options(skill, instances=1):
+    # UCI options for a skill level, sized from this machine and the number of engines sharing it:
+    # `instances` in this process times MACHINE_INSTANCES programs like this one
+    cpu_share, memory_share, max_hash, multipv, move_overhead = ENGINE_PROFILES.get(skill, (0.0, 0.0, MIN_HASH_MB, 1, 10))
+    instances = max(instances, 1) * MACHINE_INSTANCES
+    threads = max(1, int((os.cpu_count() or 1) * cpu_share / instances))
+    free_memory = get_free_memory_mb() or FALLBACK_FREE_MEMORY_MB
+    hash_mb = max(MIN_HASH_MB, int(free_memory * memory_share / instances))
+    if max_hash is not None:
+        hash_mb = min(hash_mb, max_hash)
+    options = {"Threads": threads, "Hash": hash_mb, "MultiPV": multipv, "Move Overhead": move_overhead}
+    if os.path.isdir(SYZYGY_PATH):
+        options["SyzygyPath"] = SYZYGY_PATH # Let the engine's own search use the tables too
+    if skill is not None:
+        options["Skill Level"] = skill
+    return options
+
+def get_changed_options(engine, configured_options, options):
+    # The options that differ from what the engine was last sent, clamped to the engine's limits
+    changed = {}
+    for name, value in options.items():
+        option = engine.options.get(name)
+        if option is None or option.is_managed():
+            continue # Not supported by this engine, or set per search (MultiPV)
+        if isinstance(value, int) and option.min is not None and option.max is not None:
+            value = min(max(value, option.min), option.max)
+        if configured_options.get(name) != value:
+            changed[name] = value
+    return changed
+
+def describe_engine_options(options):
+    return f"{options['Threads']}/{options['Hash']}MB" # Threads/Hash, short enough for the menu status line
+
+# --- Endgame Tablebase ---
+def get_tablebase():
+    # Opened lazily on first use; at most SYZYGY_MAX_OPEN_FILES table files are kept open
+    global tablebase, tablebase_checked, tablebase_max_pieces
+    if not tablebase_checked:
+        tablebase_checked = True
+        if os.path.isdir(SYZYGY_PATH):
             try:
-                # Create the final move object from the correctly formed UCI string
-                promoted_move = chess.Move.from_uci(final_uci)
-
-                # Double-check this constructed move is actually legal in the current position
-                if promoted_move in board.legal_moves:
-                     board.push(promoted_move)
-                     promotion_move = None # Clear promotion state AFTER successful push
-                     is_player_move = False # Switch turn to AI
-                     game_over_text = check_game_over() # Check if this move ended the game
-                     print("Promotion successful. Turn switched to AI.")
-                     return True # Indicate promotion was handled
+                tablebase = chess.syzygy.Tablebase(max_fds=SYZYGY_MAX_OPEN_FILES)
+                if tablebase.add_directory(SYZYGY_PATH):
+                    tablebase_max_pieces = max(len(name) - 1 for name in tablebase.wdl) # "KRvK" -> 3 pieces
+                    logger.info("Syzygy tablebases loaded: %s (up to %s pieces)", SYZYGY_PATH, tablebase_max_pieces)
                 else:
-                    # This could happen if something went very wrong, but good to check
-                    print(f"Error: Constructed promotion move {final_uci} is illegal in current board state?")
-                    promotion_move = None # Reset promotion state on error
-                    return False
-            # --- END CHANGE ---
-
-            except ValueError as e: # Catch potential errors from from_uci
-                 print(f"Error creating move from UCI '{final_uci}': {e}")
-                 promotion_move = None # Reset promotion state on error
-                 return False
-            except Exception as e:
-                 print(f"Error processing promotion click: {e}")
-                 promotion_move = None # Reset on error
-                 return False
-    return False # Click was not on a promotion button
+                    logger.warning("No Syzygy tables found in %s.", SYZYGY_PATH)
+                    tablebase.close()
+                    tablebase = None
+            except OSError as e:
+                logger.error("Error opening tablebases %s: %s", SYZYGY_PATH, e)
+                tablebase = None
+    return tablebase
+
+def in_tablebase(board, max_pieces):
+    return chess.popcount(board.occupied) <= max_pieces and not board.castling_rights
+
+def get_tablebase_result(board):
+    # "White wins" etc. if the tables know the result of this position, otherwise None
+    tb = get_tablebase()
+    if tb is None or not in_tablebase(board, tablebase_max_pieces):
+        return None
+    try:
+        wdl = tb.probe_wdl(board)
+    except KeyError: # Table missing
+        return None
+    if wdl == 0 or abs(wdl) == 1: # Cursed win / blessed loss: drawn by the 50-move rule
+        return "Tablebase: Draw"
+    winner = board.turn if wdl > 0 else not board.turn
+    return f"Tablebase: {'White' if winner == chess.WHITE else 'Black'} wins"
+
+def get_tablebase_move(board, skill):
+    # Best move by the tables: win > draw > loss, then quickest win / slowest loss by DTZ
+    tb = get_tablebase()
+    if tb is None or not in_tablebase(board, min(SYZYGY_PIECES.get(skill, 0), tablebase_max_pieces)):
+        return None
+    best_move, best_key = None, None
+    try:
+        for move in board.legal_moves:
+            board.push(move)
+            try:
+                wdl = -tb.probe_wdl(board) # Probed from the opponent's side
+                dtz = -tb.probe_dtz(board)
+            finally:
+                board.pop()
+            key = (wdl, -abs(dtz) if wdl > 0 else abs(dtz))
+            if best_key is None or key > best_key:
+                best_move, best_key = move, key
+    except KeyError: # Table missing
+        return None
+    return best_move
+
+# --- Opening Book ---
+def get_opening_book():
+    # Opened lazily on first use; the reader memory-maps the file and binary-searches it
+    global opening_book, opening_book_checked
+    if not opening_book_checked:
+        opening_book_checked = True
+        if os.path.exists(OPENING_BOOK_PATH):
+            try:
+                opening_book = chess.polyglot.open_reader(OPENING_BOOK_PATH)
+                logger.info("Opening book loaded: %s", OPENING_BOOK_PATH)
+            except (OSError, ValueError) as e:
+                logger.error("Error opening book %s: %s", OPENING_BOOK_PATH, e)
+        else:
+            logger.info("No opening book found at %s, engine plays every move.", OPENING_BOOK_PATH)
+    return opening_book
+
+def get_book_move(board, skill):
+    # Weighted random book move while the position is in book and within the ply limit for this skill
+    if board.ply() >= OPENING_BOOK_PLIES.get(skill, 0):
+        return None
+    book = get_opening_book()
+    if book is None:
+        return None
+    try:
+        return book.weighted_choice(board).move
+    except IndexError:
+        return None # Out of book
+
+# --- Position Cache ---
+def get_position_cache_key(board, skill):
+    # Same position, skill and time budget -> same stored answer
+    base_time = TIME_PROFILES.get(skill, (ENGINE_MOVE_TIME, None, None))[0]
+    return f"{chess.polyglot.zobrist_hash(board):016x}:{skill}:{base_time}"
+
+def get_position_cache():
+    global position_cache
+    if position_cache is None:
+        position_cache = OrderedDict()
+        try:
+            with open(POSITION_CACHE_PATH) as f:
+                for key, move_uci, cp, mate in json.load(f): # Stored oldest first
+                    position_cache[key] = (move_uci, cp, mate)
+            logger.info("Position cache loaded: %s positions.", len(position_cache))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError) as e:
+            logger.error("Error loading position cache %s: %s", POSITION_CACHE_PATH, e)
+            position_cache.clear()
+    return position_cache
+
+def lookup_cached_move(board, skill):
+    cache = get_position_cache()
+    key = get_position_cache_key(board, skill)
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    move_uci, cp, mate = entry
+    move = chess.Move.from_uci(move_uci)
+    if move not in board.legal_moves: # Hash collision or a corrupt entry
+        del cache[key]
+        return None
+    cache.move_to_end(key) # Most recently used
+    info = {}
+    if cp is not None or mate is not None:
+        score = chess.engine.Cp(cp) if mate is None else chess.engine.Mate(mate)
+        info["score"] = chess.engine.PovScore(score, chess.WHITE)
+    return chess.engine.PlayResult(move, None, info=info)
+
+def store_cached_move(board, skill, result):
+    global position_cache_dirty
+    cache = get_position_cache()
+    score = result.info.get("score")
+    cp = mate = None
+    if score is not None:
+        white_score = score.white()
+        cp, mate = white_score.score(), white_score.mate()
+    key = get_position_cache_key(board, skill)
+    cache[key] = (result.move.uci(), cp, mate)
+    cache.move_to_end(key)
+    while len(cache) > POSITION_CACHE_SIZE:
+        cache.popitem(last=False) # Evict least recently used
+    position_cache_dirty = True
+
+def save_position_cache(background=False):
+    # Writes the cache if it changed. In the background the JSON (up to POSITION_CACHE_SIZE
+    # entries) is built and written on a thread, so starting a new game doesn't stall a frame.
+    global position_cache_dirty, position_cache_writer
+    if position_cache_writer is not None:
+        if background and position_cache_writer.is_alive():
+            return # Still writing; the entries added meanwhile go out with the next save
+        position_cache_writer.join()
+        position_cache_writer = None
+    if position_cache is None or not position_cache_dirty:
+        return
+    entries = list(position_cache.items()) # Snapshot; the entries themselves are immutable tuples
+    position_cache_dirty = False
+    if background:
+        position_cache_writer = threading.Thread(target=write_position_cache, args=(entries,), name="position-cache-writer", daemon=True)
+        position_cache_writer.start()
+    else:
+        write_position_cache(entries)
+
+def write_position_cache(entries):
+    global position_cache_dirty
+    try:
+        os.makedirs(os.path.dirname(POSITION_CACHE_PATH), exist_ok=True)
+        temp_path = POSITION_CACHE_PATH + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump([[key, *entry] for key, entry in entries], f)
+        os.replace(temp_path, POSITION_CACHE_PATH) # Never leave a half-written cache behind
+        logger.info("Position cache saved: %s positions.", len(entries))
+    except OSError as e:
+        logger.error("Error saving position cache: %s", e)
+        position_cache_dirty = True # Try again with the next save
+
+# --- Game Journal ---
+class GameJournal:
+    """Write-ahead log of the game in progress, so that it survives the process dying.
+
+    One line per record: "G <skill> <unix time>" starts a game (and replaces the previous
+    one), then one UCI move per line, and "R <result>" once the game is over. Records go to a
+    writer thread that writes them in batches and fsyncs at most every JOURNAL_SYNC_INTERVAL,
+    so the game loop never waits for the disk. The same thread appends finished games to the
+    PGN archive, which is only ever appended to and never read.
+    """
+
+    def __init__(self, path=JOURNAL_PATH, archive_path=PGN_ARCHIVE_PATH):
+        self.path = path
+        self.archive_path = archive_path
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="journal-writer", daemon=True)
+        self.thread.start()
+
+    def start_game(self, skill):
+        self.requests.put(("start", f"G {skill} {int(time.time())}\n"))
+
+    def record_move(self, move):
+        self.requests.put(("move", move.uci() + "\n"))
+
+    def resume_game(self, skill, moves):
+        # Rewrites the journal with just the moves read back from it, so that new moves are never
+        # appended to a torn last line
+        self.requests.put(("start", f"G {skill} {int(time.time())}\n" + "".join(move.uci() + "\n" for move in moves)))
+
+    def finish_game(self, board, skill, result):
+        self.requests.put(("finish", f"R {result}\n", board.copy(), skill, result))
+
+    def close(self):
+        self.requests.put(None) # Writes what is still queued, syncs and stops the thread
+        self.thread.join(timeout=5)
+
+    def run(self):
+        journal_file = None
+        sync_deadline = None # Set while there are writes that have not been fsynced
+        while True:
+            timeout = None if sync_deadline is None else max(sync_deadline - time.monotonic(), 0)
+            try:
+                request = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                request = () # Time to sync
+            try:
+                if request:
+                    if request[0] == "start" or journal_file is None:
+                        if journal_file is not None:
+                            journal_file.close()
+                        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                        journal_file = open(self.path, "w" if request[0] == "start" else "a") # Only the current game is kept
+                    journal_file.write(request[1])
+                    if request[0] == "finish":
+                        self.archive_game(*request[2:])
+                    if sync_deadline is None:
+                        sync_deadline = time.monotonic() + JOURNAL_SYNC_INTERVAL
+                elif sync_deadline is not None:
+                    journal_file.flush()
+                    os.fsync(journal_file.fileno())
+                    sync_deadline = None
+            except OSError as e:
+                logger.error("Error writing game journal %s: %s", self.path, e)
+                sync_deadline = None
+            if request is None:
+                break
+        if journal_file is not None:
+            journal_file.close()
+
+    def archive_game(self, board, skill, result):
+        game = chess.pgn.Game.from_board(board)
+        game.headers["Event"] = "Dragonex Technologies Chess"
+        game.headers["Date"] = time.strftime("%Y.%m.%d")
+        game.headers["White"] = "Player"
+        game.headers["Black"] = f"Stockfish skill {skill}"
+        game.headers["Result"] = result
+        os.makedirs(os.path.dirname(self.archive_path), exist_ok=True)
+        with open(self.archive_path, "a") as f:
+            game.accept(chess.pgn.FileExporter(f)) # Streamed straight into the file
+        logger.info("Game archived to %s (%s).", self.archive_path, result)
+
+def load_journal(path=JOURNAL_PATH):
+    # (skill, moves) of an unfinished game in the journal, or None if there is nothing to resume
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.error("Error reading game journal %s: %s", path, e)
+        return None
+    try:
+        tag, skill, _ = lines[0].split()
+        skill = int(skill)
+    except (IndexError, ValueError):
+        return None
+    if tag != "G":
+        return None
+    board = chess.Board()
+    moves = []
+    for line in lines[1:]:
+        if line.startswith("R "):
+            return None # Finished; it is in the archive
+        try:
+            move = chess.Move.from_uci(line)
+        except ValueError:
+            break # Torn last write
+        if move not in board.legal_moves:
+            break
+        board.push(move)
+        moves.append(move)
+    return (skill, moves) if moves else None
 
-def handle_board_click(pos, square_size, board_origin):
-     global selected_square, possible_moves, board, is_player_move, promotion_move, game_over_text, animating, animation_piece, animation_start_time, animation_start_pos, animation_end_pos, last_player_move
+# --- Load Stockfish Engine ---
+def load_engine(engine_path=ENGINE_PATH):
+    # Returns a running engine, or None so the game knows it's unavailable
+    try:
+        logger.info("Attempting to load engine from: %s", engine_path)
+        # Make sure the path exists before trying to open
+        if not os.path.exists(engine_path):
+             raise FileNotFoundError(f"Engine executable not found at resolved path: {engine_path}")
+
+        loaded_engine = chess.engine.SimpleEngine.popen_uci(engine_path)
+        # Engine is loaded, but difficulty will be configured later via menu
+        logger.info("Stockfish engine loaded successfully.")
+        return loaded_engine
+    except FileNotFoundError as e:
+        logger.error("Stockfish engine not found. %s", e)
+        logger.warning("Please ensure Stockfish is installed and the path in the script is correct.")
+    except chess.engine.EngineError as e:
+        logger.error("Error initializing Stockfish engine: %s", e)
+    except Exception as e:
+        logger.error("An unexpected error occurred loading the engine: %s", e)
+    return None
 
-     # Get clicked square relative to board origin
-     clicked_square_name = get_square_from_pos(pos, square_size, board_origin)
+# --- Engine Worker ---
+class EngineWorker:
+    """Runs searches for one engine on a dedicated thread.
+
+    Searches are queued with submit() and their results are put on the results queue
+    handed in with the request, tagged with the search id. Running searches use
+    engine.analysis() so that they can be stopped (stop/cancel) at any time.
+    Engine options are only sent when they change, and if the engine process dies it is
+    started again and the search retried once.
+    """
+
+    def __init__(self, engine, engine_path=ENGINE_PATH):
+        self.engine = engine
+        self.engine_path = engine_path # Used to start a new engine if this one dies
+        self.configured_options = {} # Options as last sent to the engine
+        self.requests = queue.Queue() # (search id, board copy, engine options, limit, game, results queue, on_info), or None to exit
+        self.search_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.pending_ids = set() # Queued or running searches
+        self.cancelled_ids = set() # Queued searches that must be skipped
+        self.current_id = None
+        self.current_search = None # Running engine.analysis() handle
+        self.thread = threading.Thread(target=self.run, name="engine-worker", daemon=True)
+        self.thread.start()
+
+    def submit(self, board, options, limit, results, game=None, on_info=None):
+        # A different `game` than the previous search makes the engine start a new game (ucinewgame).
+        # on_info(search id, info) is called from the worker thread for every info line the engine sends.
+        search_id = next(self.search_ids)
+        with self.lock:
+            self.pending_ids.add(search_id)
+        self.requests.put((search_id, board.copy(), options, limit, game, results, on_info))
+        return search_id
+
+    def stop(self, search_id):
+        # Ends a running search early; the best move found so far is still reported
+        with self.lock:
+            if self.current_id == search_id and self.current_search is not None:
+                self.current_search.stop()
+                return True
+        return False
 
-     if not clicked_square_name:
-         print("Click outside board")
-         return False # Click was outside the board
+    def cancel(self, search_id):
+        # Like stop(), but a search that has not started yet is dropped altogether
+        with self.lock:
+            if self.current_id == search_id and self.current_search is not None:
+                self.current_search.stop()
+            elif search_id in self.pending_ids:
+                self.cancelled_ids.add(search_id)
+
+    def configure(self, options):
+        # Only changed options are sent: setting Hash or Threads makes the engine reallocate
+        changed = get_changed_options(self.engine, self.configured_options, options)
+        if changed:
+            logger.debug("Engine options set: %s", changed)
+            self.engine.configure(changed)
+            self.configured_options.update(changed)
+
+    def health_check(self):
+        # True if the engine process is running and answers
+        if self.engine.returncode.done():
+            return False
+        try:
+            self.engine.ping()
+            return True
+        except (chess.engine.EngineError, TimeoutError):
+            return False
 
-     clicked_square_index = chess.parse_square(clicked_square_name)
-     piece = board.piece_at(clicked_square_index)
+    def restart_engine(self):
+        logger.info("Restarting engine...")
+        try:
+            self.engine.close()
+        except Exception:
+            pass # Already gone
+        new_engine = load_engine(self.engine_path)
+        if new_engine is None:
+            return False
+        self.engine = new_engine
+        self.configured_options = {} # The new process starts with default options
+        return True
+
+    def search(self, search_id, search_board, options, limit, game, on_info):
+        # Returns the engine's PlayResult, or None if the search was cancelled before it started
+        options = options or {}
+        with self.lock:
+            if search_id in self.cancelled_ids:
+                return None # Stale: the engine's options are left as they are
+        self.configure(options)
+        with self.lock:
+            if search_id in self.cancelled_ids:
+                return None # Cancelled while the options were being sent
+            self.current_id = search_id
+            self.current_search = self.engine.analysis(search_board, limit, multipv=options.get("MultiPV"), game=game)
+        if on_info is not None:
+            for info in self.current_search: # Ends once the search is stopped or finishes
+                on_info(search_id, info)
+        best = self.current_search.wait()
+        return chess.engine.PlayResult(best.move, best.ponder, info=self.current_search.info)
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            search_id, search_board, options, limit, game, results, on_info = request
+            try:
+                try:
+                    result = self.search(search_id, search_board, options, limit, game, on_info)
+                except chess.engine.EngineTerminatedError as e:
+                    logger.warning("Engine process died (%s).", e)
+                    if not self.restart_engine():
+                        raise
+                    result = self.search(search_id, search_board, options, limit, game, on_info)
+            except Exception as e:
+                result = e
+            with self.lock:
+                self.current_id = None
+                self.current_search = None
+                self.pending_ids.discard(search_id)
+                self.cancelled_ids.discard(search_id)
+            if result is not None and results is not None:
+                results.put((search_id, result))
+
+    def close(self, quit_engine=False):
+        self.requests.put(None) # Tell the worker to exit
+        with self.lock:
+            if self.current_search is not None:
+                self.current_search.stop()
+        self.thread.join(timeout=2)
+        if quit_engine:
+            try:
+                self.engine.quit()
+            except chess.engine.EngineTerminatedError:
+                logger.warning("Engine already terminated.")
+            except Exception as e:
+                logger.error("Error quitting engine: %s", e)
+
+# --- Engine Pool ---
+class EnginePool:
+    """Keeps engine processes warm and leases them (with their EngineWorker) to game sessions.
+
+    lease() hands out an idle engine, starting a new one only while fewer than max_engines
+    exist; release() takes it back without stopping it, so the next game reuses the process.
+    Idle engines are health-checked before being leased again and restarted if they died.
+    Neither the health check nor starting an engine holds the lock, and the UI leases through
+    lease_async() so the window keeps responding while an engine starts.
+    """
+
+    def __init__(self, engine_path=ENGINE_PATH, max_engines=ENGINE_POOL_SIZE):
+        self.engine_path = engine_path
+        self.max_engines = max_engines
+        self.lock = threading.Lock()
+        self.idle_workers = [] # Warm engines nobody is using
+        self.leased_workers = set()
+        self.starting = False # True while warm_up_async is starting engines
+        self.engines_starting = 0 # Engines lease() is starting right now; they count towards max_engines
+        self.closed = False
+
+    def start_worker(self):
+        new_engine = load_engine(self.engine_path)
+        return EngineWorker(new_engine, self.engine_path) if new_engine else None
+
+    def warm_up(self, count=1):
+        # Start engines ahead of time so the first game does not have to wait for one.
+        # The lock is not held during the UCI handshake, so is_ready()/status() answer meanwhile.
+        while True:
+            with self.lock:
+                if self.closed:
+                    return False
+                if len(self.idle_workers) + len(self.leased_workers) >= min(count, self.max_engines):
+                    return True
+            worker = self.start_worker()
+            if worker is None:
+                return False
+            with self.lock:
+                if not self.closed:
+                    self.idle_workers.append(worker)
+                    continue
+            worker.close(quit_engine=True) # Pool was closed while this engine was starting
+            return False
+
+    def warm_up_async(self, count=1, on_done=None):
+        # warm_up() on a background thread; on_done(ready) is called from that thread when it is over
+        def run():
+            ready = self.warm_up(count)
+            with self.lock:
+                self.starting = False
+                closed = self.closed
+            if on_done and not closed:
+                on_done(ready)
+
+        self.starting = True
+        threading.Thread(target=run, name="EngineWarmUp", daemon=True).start()
+
+    def is_ready(self):
+        with self.lock:
+            return bool(self.idle_workers or self.leased_workers)
+
+    def status(self):
+        # "ready", "starting" or "error"
+        with self.lock:
+            if self.idle_workers or self.leased_workers:
+                return "ready"
+            return "starting" if self.starting else "error"
+
+    def engine_count(self):
+        # Engines in use at the same time; the machine's cores and memory are split between them
+        with self.lock:
+            return max(len(self.leased_workers), 1)
+
+    def lease(self):
+        # Returns an EngineWorker for the caller's exclusive use, or None if none can be had.
+        # Can take as long as an engine startup; the UI calls lease_async() instead.
+        while True:
+            with self.lock:
+                if self.closed:
+                    return None
+                if self.idle_workers:
+                    worker = self.idle_workers.pop()
+                    self.leased_workers.add(worker) # Reserved while it is checked
+                elif len(self.leased_workers) + self.engines_starting >= self.max_engines:
+                    logger.warning("No engine available: all %s engines are in use.", self.max_engines)
+                    return None
+                else:
+                    worker = None
+                    self.engines_starting += 1
+            if worker is not None:
+                healthy = worker.health_check() or (not self.closed and worker.restart_engine())
+                with self.lock:
+                    if self.closed:
+                        return None # close() has quit it with the other leased engines
+                    if healthy:
+                        return worker
+                    self.leased_workers.discard(worker)
+                worker.close() # Dead and can't be restarted
+                continue
+            worker = self.start_worker()
+            with self.lock:
+                self.engines_starting -= 1
+                if worker is not None and not self.closed:
+                    self.leased_workers.add(worker)
+                    return worker
+            if worker is not None:
+                worker.close(quit_engine=True) # Pool was closed while this engine was starting
+            return None
+
+    def lease_async(self, count=1, on_done=None):
+        # Leases up to `count` engines on a background thread; on_done(list of workers, possibly
+        # empty) is called from that thread. If the pool is closed meanwhile they are quit instead.
+        def run():
+            workers = []
+            for _ in range(count):
+                worker = self.lease()
+                if worker is None:
+                    break
+                workers.append(worker)
+            with self.lock:
+                closed = self.closed
+            if closed:
+                for worker in workers:
+                    worker.close(quit_engine=True)
+            elif on_done:
+                on_done(workers)
+
+        threading.Thread(target=run, name="EngineLease", daemon=True).start()
+
+    def release(self, worker):
+        with self.lock:
+            if worker in self.leased_workers:
+                self.leased_workers.discard(worker)
+                self.idle_workers.append(worker)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            workers = self.idle_workers + list(self.leased_workers)
+            self.idle_workers = []
+            self.leased_workers.clear()
+        for worker in workers:
+            worker.close(quit_engine=True)
+
+# --- Game Session ---
+class GameSession:
+    """One game of the human (White) against the engine (Black).
+
+    Holds the board and everything about the game's progress, but knows nothing about
+    pygame: clicks come in as square names and promotion choices, and `on_move(move)` is
+    called after every move (with the board as it was before) so a UI can animate it. Without a UI (headless) it can be
+    driven directly, e.g. by test or batch tooling, with or without an engine.
+    """
+
+    def __init__(self, engine=None, engine_difficulty=None, worker=None, on_move=None, pool=None, ponder=PONDER_ENABLED, game_time=ENGINE_GAME_TIME, journal=None, game_key=None):
+        self.engine_difficulty = engine_difficulty # Skill level picked in the menu (e.g. 1, 8, 15, 20)
+        self.pool = pool # Set if the worker is leased from it and goes back on close()
+        if worker is None and self.pool is not None:
+            worker = self.pool.lease()
+        self.owns_worker = worker is None and engine is not None
+        self.worker = EngineWorker(engine) if self.owns_worker else worker
+        self.update_engine_options() # Threads, Hash etc. for this difficulty
+        self.on_move = on_move
+        self.ponder = ponder # Off where the worker is shared: a ponder search would hold up the other games
+        self.game_time = game_time # Seconds on the engine's clock per game (None = no clock)
+        self.journal = journal # GameJournal every move is recorded in, if any
+        self.journal_finished = False # Set once the result of the current game is in the journal
+        self.shared_game_key = game_key # Set where several sessions share one engine: no ucinewgame between their searches
+        self.engine_results = queue.Queue() # (search id, PlayResult or the exception raised)
+        self.engine_search_id = None # Search whose result we are waiting for (or pondering)
+        self.engine_searching = False # True while waiting for a reply for the current position
+        self.ponder_move = None # Player reply the engine is currently pondering on
+        self.ponder_start_time = 0
+        self.ponder_deadline = None # When a ponder hit search has used up its time budget
+        self.engine_turn_start = 0 # When the engine's current turn began
+        self.engine_move_times = [] # Seconds actually used per engine move this game
+        self.last_engine_info = {} # Search info (depth, nps, ...) of the engine's last move
+        # Legal moves of the current position, indexed once per board.push (see build_move_index)
+        self.legal_moves_from = {} # from square -> [moves]
+        self.legal_moves_by_squares = {} # (from square, to square) -> [moves], several for promotions
+        self.legal_destinations = {} # from square -> bitboard of destination squares
+        self.legal_move_count = 0
+        self.tablebase_result = None # e.g. "Tablebase: White wins" once the tables know the result
+        self.restart_game()
+
+    def restart_game(self):
+        logger.info("Restarting game...")
+        self.cancel_engine_search() # A search for the old game must not land on the new board
+        self.game_key = self.shared_game_key or object() # New key -> the engine gets ucinewgame before its next search
+        self.board = chess.Board()
+        self.position_counts = {} # Zobrist hash -> times the position occurred this game
+        self.build_move_index()
+        self.selected_square = None
+        self.possible_moves = []
+        self.is_player_move = True # Player (White) starts
+        self.game_over_text = None
+        self.promotion_move = None  # Stores the move that resulted in promotion
+        self.last_player_move = None # Store the last player move for visual feedback
+        self.engine_clock_remaining = self.game_time # Seconds left on the engine's game clock
+        self.engine_move_times.clear()
+        self.journal_finished = False
+        if self.journal:
+            self.journal.start_game(self.engine_difficulty)
+        save_position_cache(background=True)
+
+    def update_engine_options(self):
+        # Called again whenever the number of engines in use changes (e.g. analysis on or off),
+        # so the engines together never take more than this program's share of the machine
+        instances = self.pool.engine_count() if self.pool is not None else 1
+        self.engine_options = get_engine_options(self.engine_difficulty, instances) # Sent with the next search
+
+    def close(self):
+        self.cancel_engine_search()
+        if self.owns_worker:
+            self.worker.close()
+        elif self.pool is not None and self.worker is not None:
+            self.pool.release(self.worker) # Engine stays warm for the next session
+        self.worker = None
+
+    def build_move_index(self):
+        # One pass over the legal moves; clicks, highlights and promotion checks then only do lookups
+        self.legal_move_count = 0
+        self.legal_moves_from.clear()
+        self.legal_moves_by_squares.clear()
+        self.legal_destinations.clear()
+        for move in self.board.legal_moves:
+            self.legal_moves_from.setdefault(move.from_square, []).append(move)
+            self.legal_moves_by_squares.setdefault((move.from_square, move.to_square), []).append(move)
+            self.legal_destinations[move.from_square] = self.legal_destinations.get(move.from_square, 0) | chess.BB_SQUARES[move.to_square]
+            self.legal_move_count += 1
+        self.update_outcome()
+
+    def update_outcome(self):
+        # Game-over state for the position just reached, from the move index and a running
+        # repetition count; check_game_over()/is_game_over() only read the cached result.
+        board = self.board
+        key = chess.polyglot.zobrist_hash(board)
+        self.position_counts[key] = self.position_counts.get(key, 0) + 1
+        if self.legal_move_count == 0:
+            if board.is_check():
+                winner = "Black (AI)" if board.turn == chess.WHITE else "White (You)"
+                self.outcome = f"Checkmate! {winner} wins."
+            else:
+                self.outcome = "Stalemate!"
+        elif board.is_insufficient_material():
+            self.outcome = "Draw: Insufficient material!"
+        elif board.halfmove_clock >= 150:
+            self.outcome = "Draw: 75-move rule!"
+        elif self.position_counts[key] >= 5:
+            self.outcome = "Draw: Fivefold repetition!"
+        elif board.is_variant_draw(): # Catches other draw conditions if applicable
+            self.outcome = "Draw!"
+        else:
+            self.outcome = None # Game is not over
+        self.tablebase_result = None if self.outcome else get_tablebase_result(board)
+
+    def push_move(self, move):
+        # Every move of both sides comes through here, so this is where the move list is logged
+        board_before = self.board.copy(stack=False) if self.on_move else None # Lets a UI see captures and castling
+        if logger.isEnabledFor(logging.INFO):
+            side = "White (You)" if self.board.turn == chess.WHITE else "Black (AI)"
+            logger.info("Move %s%s %s  [%s, %s]", self.board.fullmove_number, "." if self.board.turn == chess.WHITE else "...", self.board.san(move), move.uci(), side)
+        self.board.push(move)
+        self.build_move_index()
+        if self.journal:
+            self.journal.record_move(move)
+            if self.outcome:
+                self.finish_journal()
+        if self.on_move:
+            self.on_move(move, board_before)
+
+    def finish_journal(self, result=None):
+        # Marks the game as over in the journal and archives it; the result comes from the board unless given
+        if self.journal and not self.journal_finished:
+            if result is None:
+                outcome = self.board.outcome()
+                result = outcome.result() if outcome else "1/2-1/2"
+            self.journal.finish_game(self.board, self.engine_difficulty, result)
+            self.journal_finished = True
+
+    def check_game_over(self):
+        return self.outcome # Game over text, or None if the game is not over
+
+    def is_game_over(self):
+        return self.outcome is not None
+
+    def is_engine_turn(self):
+        return not self.is_player_move and not self.promotion_move and not self.game_over_text and not self.is_game_over()
+
+    # --- Player Input ---
+    def handle_promotion_click(self, promotion_piece_char):
+        if not self.promotion_move: # Should not happen if called correctly, but safe check
+            logger.error("handle_promotion_click called without a pending promotion_move.")
+            return False
+
+        # promotion_move holds the base move (e.g., d7c8 squares)
+        base_uci = self.promotion_move.uci() # Get UCI like "d7c8"
+        final_uci = base_uci + promotion_piece_char # Append choice, e.g., "d7c8" + "q" -> "d7c8q"
+        logger.debug("Attempting promotion move: %s", final_uci)
 
-     if selected_square is None:
-         # Player clicked on a square, potential piece selection
-         if piece and piece.color == chess.WHITE: # Player is always White
-             selected_square = clicked_square_name
-             possible_moves = [move for move in board.legal_moves if move.from_square == clicked_square_index]
-             print(f"Selected square: {selected_square}. Possible moves: {[m.uci() for m in possible_moves]}")
-             return False # Just selected, no move made yet
-         else:
-             print("Clicked on empty square or opponent's piece - deselecting.")
-             selected_square = None
-             possible_moves = []
+        try:
+            # Create the final move object from the correctly formed UCI string
+            promoted_move = chess.Move.from_uci(final_uci)
+
+            # Double-check this constructed move is actually legal in the current position
+            if promoted_move in self.legal_moves_by_squares.get((promoted_move.from_square, promoted_move.to_square), []):
+                 self.push_move(promoted_move)
+                 self.last_player_move = promoted_move
+                 self.promotion_move = None # Clear promotion state AFTER successful push
+                 self.is_player_move = False # Switch turn to AI
+                 self.game_over_text = self.check_game_over() # Check if this move ended the game
+                 logger.debug("Promotion successful. Turn switched to AI.")
+                 return True # Indicate promotion was handled
+            else:
+                # This could happen if something went very wrong, but good to check
+                logger.error("Constructed promotion move %s is illegal in current board state?", final_uci)
+                self.promotion_move = None # Reset promotion state on error
+                return False
+
+        except ValueError as e: # Catch potential errors from from_uci
+             logger.error("Error creating move from UCI '%s': %s", final_uci, e)
+             self.promotion_move = None # Reset promotion state on error
              return False
-     else:
-         # A piece was already selected, try to move or deselect
-         from_square_index = chess.parse_square(selected_square)
-
-         if clicked_square_name == selected_square:
-             # Clicked the same square again - deselect
-             print("Deselected square.")
-             selected_square = None
-             possible_moves = []
+        except Exception as e:
+             logger.error("Error processing promotion click: %s", e)
+             self.promotion_move = None # Reset on error
              return False
 
-         # Construct potential move (without promotion initially)
-         move_uci = selected_square + clicked_square_name
-         potential_move = chess.Move.from_uci(move_uci)
-         is_promotion = (
-             board.piece_at(from_square_index).piece_type == chess.PAWN and
-             chess.square_rank(clicked_square_index) == 7 # White promotes on rank 8 (index 7)
-         )
-
-         # Check if this exact move (without promotion yet) is legal
-         # We need to check with potential promotion possibilities as well
-         found_legal_move = False
-         actual_move_to_push = None
-
-         for legal_move in board.legal_moves:
-             if legal_move.from_square == from_square_index and legal_move.to_square == clicked_square_index:
-                 found_legal_move = True
-                 actual_move_to_push = legal_move # This includes promotion info if needed
-                 break
-
-         if found_legal_move:
-             if is_promotion:
-                 # --- START CHANGE ---
-                 print(f"Promotion condition met for move from {selected_square} to {clicked_square_name}")
-                 # Store only the base move information (from/to squares).
-                 # We create a move object just holding the squares, ignoring promotion for now.
-                 base_move = chess.Move(from_square_index, clicked_square_index)
-                 promotion_move = base_move # Store this base move object
-                 # --- END CHANGE ---
-
-                 selected_square = None
-                 possible_moves = []
-                 print("Waiting for promotion selection.")
-                 return False # Move sequence initiated but needs promotion choice
+    def handle_board_click(self, clicked_square_name):
+         clicked_square_index = chess.parse_square(clicked_square_name)
+         piece = self.board.piece_at(clicked_square_index)
+
+         if self.selected_square is None:
+             # Player clicked on a square, potential piece selection
+             if piece and piece.color == chess.WHITE: # Player is always White
+                 self.selected_square = clicked_square_name
+                 self.possible_moves = self.legal_moves_from.get(clicked_square_index, [])
+                 if logger.isEnabledFor(logging.DEBUG):
+                     logger.debug("Selected square: %s. Possible moves: %s", self.selected_square, [m.uci() for m in self.possible_moves])
+                 return False # Just selected, no move made yet
              else:
-                 # Regular legal move (no changes needed here)
-                 print(f"Making move: {actual_move_to_push.uci()}")
-                 start_pos = get_pos_from_square(selected_square, square_size, board_origin)
-                 end_pos = get_pos_from_square(clicked_square_name, square_size, board_origin)
-                 piece = board.piece_at(from_square_index)
-                 if piece:
-                     start_animation(selected_square, start_pos, end_pos)
-                     board.push(actual_move_to_push)
-                     last_player_move = actual_move_to_push
-                     selected_square = None
-                     possible_moves = []
-                     is_player_move = False # Switch turn to AI
-                     game_over_text = check_game_over() # Check game status
-                     print("Move successful. Turn switched to AI.")
-                     return True # Move completed
-                 else:
-                     print("Error: No piece at the starting square of the move.")
-                     selected_square = None
-                     possible_moves = []
-                     return False
-         else:
-             # Clicked square is not a legal destination, maybe select another piece?
-             print(f"Illegal move: {move_uci}. Checking if selecting another piece.")
-             if piece and piece.color == chess.WHITE:
-                 # Clicked on another white piece - select it instead
-                 selected_square = clicked_square_name
-                 possible_moves = [move for move in board.legal_moves if move.from_square == clicked_square_index]
-                 print(f"Selected new square: {selected_square}. Possible moves: {[m.uci() for m in possible_moves]}")
+                 logger.debug("Clicked on empty square or opponent's piece - deselecting.")
+                 self.selected_square = None
+                 self.possible_moves = []
                  return False
-             else:
-                 # Clicked on empty or black piece - deselect current
-                 print("Clicked on non-legal square - deselecting.")
-                 selected_square = None
-                 possible_moves = []
+         else:
+             # A piece was already selected, try to move or deselect
+             from_square_index = chess.parse_square(self.selected_square)
+
+             if clicked_square_name == self.selected_square:
+                 # Clicked the same square again - deselect
+                 logger.debug("Deselected square.")
+                 self.selected_square = None
+                 self.possible_moves = []
                  return False
 
-def make_engine_move():
-    global is_player_move, board, game_over_text, animating, animation_piece, animation_start_time, animation_start_pos, animation_end_pos
-
-    if animating:
-        return # Don't make a new move while animation is in progress
+             move_uci = self.selected_square + clicked_square_name
+
+             # Look up the legal moves between these squares (several if it is a promotion)
+             matching_moves = self.legal_moves_by_squares.get((from_square_index, clicked_square_index))
+             found_legal_move = bool(matching_moves)
+             actual_move_to_push = matching_moves[0] if matching_moves else None
+             is_promotion = found_legal_move and actual_move_to_push.promotion is not None
+
+             if found_legal_move:
+                 if is_promotion:
+                     logger.debug("Promotion condition met for move from %s to %s", self.selected_square, clicked_square_name)
+                     # Store only the base move information (from/to squares).
+                     # We create a move object just holding the squares, ignoring promotion for now.
+                     self.promotion_move = chess.Move(from_square_index, clicked_square_index)
+                     self.selected_square = None
+                     self.possible_moves = []
+                     logger.debug("Waiting for promotion selection.")
+                     return False # Move sequence initiated but needs promotion choice
+                 else:
+                     logger.debug("Making move: %s", actual_move_to_push)
+                     self.push_move(actual_move_to_push)
+                     self.last_player_move = actual_move_to_push
+                     self.selected_square = None
+                     self.possible_moves = []
+                     self.is_player_move = False # Switch turn to AI
+                     self.game_over_text = self.check_game_over() # Check game status
+                     logger.debug("Move successful. Turn switched to AI.")
+                     return True # Move completed
+             else:
+                 # Clicked square is not a legal destination, maybe select another piece?
+                 logger.debug("Illegal move: %s. Checking if selecting another piece.", move_uci)
+                 if piece and piece.color == chess.WHITE:
+                     # Clicked on another white piece - select it instead
+                     self.selected_square = clicked_square_name
+                     self.possible_moves = self.legal_moves_from.get(clicked_square_index, [])
+                     if logger.isEnabledFor(logging.DEBUG):
+                         logger.debug("Selected new square: %s. Possible moves: %s", self.selected_square, [m.uci() for m in self.possible_moves])
+                     return False
+                 else:
+                     # Clicked on empty or black piece - deselect current
+                     logger.debug("Clicked on non-legal square - deselecting.")
+                     self.selected_square = None
+                     self.possible_moves = []
+                     return False
 
-    if engine and not board.is_game_over():
-        print("Engine is thinking...")
+    # --- Engine Moves ---
+    def make_engine_move(self):
+        # Hands the position to the engine worker; the reply is applied by poll_engine_move
+        if self.engine_searching:
+            return # A search is already running for this position
+
+        if self.worker and not self.is_game_over():
+            self.start_engine_clock()
+            if self.legal_move_count == 1:
+                forced_move = next(iter(self.legal_moves_from.values()))[0]
+                self.play_instant_move(chess.engine.PlayResult(forced_move, None), "Forced")
+                return
+
+            tablebase_move = get_tablebase_move(self.board, self.engine_difficulty)
+            if tablebase_move:
+                self.play_instant_move(chess.engine.PlayResult(tablebase_move, None), "Tablebase")
+                return
+
+            book_move = get_book_move(self.board, self.engine_difficulty)
+            if book_move:
+                self.play_instant_move(chess.engine.PlayResult(book_move, None), "Book")
+                return
+
+            cached_result = lookup_cached_move(self.board, self.engine_difficulty)
+            if cached_result:
+                self.play_instant_move(cached_result, "Cached")
+                return
+
+            if self.ponder_move is not None:
+                if self.board.move_stack and self.board.peek() == self.ponder_move:
+                    self.ponder_hit()
+                    return
+                logger.info("Ponder miss: expected %s, stopping ponder search.", self.ponder_move)
+                self.cancel_engine_search()
+            logger.debug("Engine is thinking...")
+            if self.engine_difficulty is None:
+                logger.warning("Engine difficulty not set, using engine default skill.")
+            move_limit = get_move_limit(self.board, self.engine_difficulty, self.engine_clock_remaining)
+            self.engine_searching = True
+            self.engine_search_id = self.worker.submit(self.board, self.engine_options, move_limit, self.engine_results, self.game_key)
+        else:
+            if not self.worker: logger.warning("Engine move skipped: Engine not available.")
+            if self.is_game_over(): logger.warning("Engine move skipped: Game is over.")
+
+    def play_instant_move(self, result, source):
+        # Moves that need no search: drop any ponder search and play right away
+        if self.ponder_move is not None:
+            self.cancel_engine_search()
+        logger.info("%s move: %s", source, result.move)
+        self.apply_engine_result(result)
+
+    def start_ponder(self, expected_move):
+        # Search the position after the player's expected reply while the player is thinking
+        if not self.ponder or (self.engine_difficulty or 0) < PONDER_MIN_SKILL:
+            return
+        if not self.worker or expected_move not in self.legal_moves_by_squares.get((expected_move.from_square, expected_move.to_square), []):
+            return
+        ponder_board = self.board.copy()
+        ponder_board.push(expected_move)
+        if not any(ponder_board.generate_legal_moves()): # Mate or stalemate; no need to replay the game for draw rules
+            return
+        self.ponder_move = expected_move
+        self.ponder_start_time = time.time()
+        # Same depth/node caps as a normal move, and never longer than PONDER_MAX_TIME, so an idle
+        # player doesn't keep the engine's threads busy. If it ends before the player moves, a
+        # ponder hit just finds the result waiting.
+        _, max_depth, max_nodes = TIME_PROFILES.get(self.engine_difficulty, (ENGINE_MOVE_TIME, None, None))
+        ponder_limit = chess.engine.Limit(time=PONDER_MAX_TIME, depth=max_depth, nodes=max_nodes)
+        self.engine_search_id = self.worker.submit(ponder_board, self.engine_options, ponder_limit, self.engine_results, self.game_key)
+        logger.debug("Pondering on expected reply %s", expected_move)
+
+    def ponder_hit(self):
+        # The player made the expected move: the running ponder search becomes the real search.
+        # It already had the player's thinking time, so it only runs on until this move's
+        # budget (counted from when pondering started) is used up.
+        logger.info("Ponder hit on %s", self.ponder_move)
+        self.engine_searching = True
+        self.ponder_move = None
+        self.ponder_deadline = self.ponder_start_time + get_move_budget(self.board, self.engine_difficulty, self.engine_clock_remaining)
+
+    def poll_engine_move(self):
+        # Non-blocking: applies the engine's reply if it has arrived. Returns True if it did.
+        if self.ponder_deadline is not None and time.time() >= self.ponder_deadline:
+            if self.worker.stop(self.engine_search_id): # Budget used up; the worker reports the best move
+                self.ponder_deadline = None
         try:
-            if engine_difficulty is not None:
-                print(f"Engine using Skill Level: {engine_difficulty}")
-                engine.configure({"Skill Level": engine_difficulty})
-            else:
-                print("Warning: Engine difficulty not set, using engine default skill.")
-
-            move_limit = chess.engine.Limit(time=1.0)
-            result = engine.play(board, move_limit)
+            while True:
+                search_id, result = self.engine_results.get_nowait()
+                if search_id == self.engine_search_id:
+                    break # Results of cancelled searches are dropped
+        except queue.Empty:
+            return False
+        self.engine_searching = False
+        self.engine_search_id = None
+        self.ponder_deadline = None # Also if the ponder search finished before its deadline
+        if not isinstance(result, Exception) and result.move:
+            store_cached_move(self.board, self.engine_difficulty, result)
+        self.apply_engine_result(result)
+        return True
+
+    def wait_for_engine_move(self, timeout=None):
+        # Blocking version for headless use: starts the engine's move and waits for it to be played
+        deadline = None if timeout is None else time.time() + timeout
+        self.make_engine_move()
+        while self.engine_searching:
+            if deadline is not None and time.time() >= deadline:
+                return False
+            if not self.poll_engine_move():
+                time.sleep(0.005)
+        return True
+
+    def apply_engine_result(self, result):
+        try:
+            if isinstance(result, Exception):
+                raise result # Raised in the worker thread, handled here
 
             if result and result.move:
-                print(f"Engine move: {result.move.uci()}")
-                from_square = chess.square_name(result.move.from_square)
-                to_square = chess.square_name(result.move.to_square)
-                start_pos = get_pos_from_square(from_square, INITIAL_SQUARE_SIZE, board_origin)
-                end_pos = get_pos_from_square(to_square, INITIAL_SQUARE_SIZE, board_origin)
-                start_animation(from_square, start_pos, end_pos)
-                board.push(result.move)
-                game_over_text = check_game_over()
-                is_player_move = True  # Switch back to player's turn AFTER successful engine move
+                self.last_engine_info = result.info
+                self.stop_engine_clock(result.move)
+                self.push_move(result.move)
+                self.game_over_text = self.check_game_over()
+                self.is_player_move = True  # Switch back to player's turn AFTER successful engine move
+                if result.ponder and not self.game_over_text:
+                    self.start_ponder(result.ponder)
             else:
-                print("Engine did not return a move (or resigned/drew).")
+                logger.warning("Engine did not return a move (or resigned/drew).")
                 if result and result.resigned:
-                    game_over_text = "AI Resigned! You Win!"
+                    self.game_over_text = "AI Resigned! You Win!"
+                    self.finish_journal("1-0")
                 elif result and result.draw_offered:
-                    game_over_text = "AI Offered Draw"
+                    self.game_over_text = "AI Offered Draw"
+                    self.finish_journal("1/2-1/2")
+                else:
+                    self.game_over_text = "Engine Error - Game Over"
+                    self.finish_journal("*") # Unfinished, but not to be resumed either
 
         except chess.engine.EngineTerminatedError:
-            print("Engine terminated unexpectedly.")
-            game_over_text = "Engine Error - Game Over"
+            logger.error("Engine terminated unexpectedly.")
+            self.game_over_text = "Engine Error - Game Over"
+            self.finish_journal("*")
         except chess.engine.EngineError as e:
-            print(f"Stockfish Engine Error: {e}")
-            game_over_text = "Engine Error - Game Over"
+            logger.error("Stockfish Engine Error: %s", e)
+            self.game_over_text = "Engine Error - Game Over"
+            self.finish_journal("*")
         except Exception as e:
-            print(f"An unexpected error occurred during engine move: {e}")
-            import traceback
-            traceback.print_exc()
-            game_over_text = "Error - Game Over"
-    else:
-        if not engine: print("Engine move skipped: Engine not available.")
-        if board.is_game_over(): print("Engine move skipped: Game is over.")
-
-def check_game_over():
-    if board.is_checkmate():
-        winner = "Black (AI)" if board.turn == chess.WHITE else "White (You)"
-        return f"Checkmate! {winner} wins."
-    elif board.is_stalemate():
-        return "Stalemate!"
-    elif board.is_insufficient_material():
-        return "Draw: Insufficient material!"
-    elif board.is_seventyfive_moves():
-        return "Draw: 75-move rule!"
-    elif board.is_fivefold_repetition():
-        return "Draw: Fivefold repetition!"
-    elif board.is_variant_draw(): # Catches other draw conditions if applicable
-        return "Draw!"
-    return None # Game is not over
-
-def restart_game():
-    global board, selected_square, possible_moves, is_player_move, game_over_text, promotion_move, game_state, animating, animation_piece, animation_start_time, animation_start_pos, animation_end_pos, last_player_move
-    print("Restarting game...")
-    board = chess.Board() # p this line
-    selected_square = None
-    possible_moves = []
-    is_player_move = True # Player (White) starts
-    game_over_text = None
-    promotion_move = None
-    animating = False
-    animation_piece = None
-    animation_start_time = 0
-    animation_start_pos = None
-    animation_end_pos = None
-    last_player_move = None
+            logger.exception("An unexpected error occurred during engine move: %s", e) # Includes the traceback
+            self.game_over_text = "Error - Game Over"
+            self.finish_journal("*")
+
+    def cancel_engine_search(self):
+        self.ponder_move = None
+        self.ponder_deadline = None
+        self.engine_searching = False
+        if self.engine_search_id is not None:
+            self.worker.cancel(self.engine_search_id) # Anything still on its way is now stale
+            self.engine_search_id = None
+
+    # --- Engine Clock ---
+    def start_engine_clock(self):
+        self.engine_turn_start = time.time()
+
+    def stop_engine_clock(self, move):
+        # Charges the time since the engine's turn started to its game clock and reports it
+        used = time.time() - self.engine_turn_start
+        self.engine_move_times.append(used)
+        profiler.record("engine_move", time.perf_counter() - used, used)
+        if self.engine_clock_remaining is not None:
+            self.engine_clock_remaining = max(self.engine_clock_remaining - used, 0)
+            logger.info("Engine used %.2fs for %s (%.1fs left on its clock)", used, move, self.engine_clock_remaining)
+        else:
+            logger.info("Engine used %.2fs for %s", used, move)
+
+# --- Live Analysis ---
+class LiveAnalysis:
+    """Background MultiPV analysis of a position on its own engine.
+
+    start(board) (re)starts an infinite search; the engine's info lines are formatted into
+    text on the worker thread as they arrive, and snapshot() hands the latest text to the UI.
+    `version` goes up with every change so the UI only redraws when there is something new.
+    """
+
+    def __init__(self, worker, options):
+        self.worker = worker
+        self.options = options # Engine options incl. MultiPV
+        self.lock = threading.Lock()
+        self.search_id = None
+        self.board = None # Position being analysed
+        self.header = ""
+        self.lines = {} # MultiPV number -> formatted line
+        self.version = 0
+
+    def start(self, board):
+        self.stop()
+        with self.lock: # Held until search_id is set, so early info lines are not dropped
+            self.board = board.copy()
+            self.header = "Analysing..."
+            self.lines = {}
+            self.version += 1
+            if any(board.generate_legal_moves()): # Nothing to analyse after mate or stalemate
+                self.search_id = self.worker.submit(board, self.options, None, None, on_info=self.on_info) # Runs until stopped
+
+    def stop(self):
+        with self.lock:
+            if self.search_id is not None:
+                self.worker.cancel(self.search_id)
+                self.search_id = None
+
+    def is_running(self):
+        return self.search_id is not None
+
+    def on_info(self, search_id, info):
+        # Worker thread: keep only what the panel shows, and only for the current search
+        if "pv" not in info and "nps" not in info:
+            return
+        with self.lock:
+            if search_id != self.search_id:
+                return
+            if "pv" in info and "score" in info:
+                pv = info["pv"][:ANALYSIS_PV_MOVES]
+                try:
+                    line = self.board.variation_san(pv)
+                except ValueError:
+                    return # Illegal PV (engine out of sync); wait for the next one
+                self.lines[info.get("multipv", 1)] = f"{info.get('multipv', 1)}. {format_score(info['score'])}  {line}"
+            if "depth" in info and info.get("multipv", 1) == 1:
+                nps = info.get("nps")
+                self.header = f"Depth {info['depth']}" + (f"  {nps // 1000} kN/s" if nps else "")
+            self.version += 1
+
+    def snapshot(self):
+        with self.lock:
+            return self.version, self.header, [self.lines[n] for n in sorted(self.lines)]
+
+    def close(self):
+        self.stop()
+
+def format_score(score):
+    # White's point of view, e.g. +0.35 or #-3
+    white_score = score.white()
+    if white_score.is_mate():
+        return f"#{white_score.mate()}"
+    return f"{white_score.score() / 100:+.2f}"
 
 def quit_game():
-     global running, engine
-     print("Quitting game...")
+     global running
+     logger.info("Quitting game...")
      running = False
-     if engine:
-         try:
-             engine.quit()
-         except chess.engine.EngineTerminatedError:
-             print("Engine already terminated.")
-         except Exception as e:
-             print(f"Error quitting engine: {e}")
+     if session:
+         session.close()
+     if analysis:
+         analysis.close()
+     stop_simul()
+     if engine_pool:
+         engine_pool.close() # Quits every engine process
+     if opening_book:
+         opening_book.close()
+     if tablebase:
+         tablebase.close()
+     save_position_cache()
+     if game_journal:
+         game_journal.close() # Writes and syncs what is still queued
+     if database_browser:
+         database_browser.close()
+     if profiler.enabled:
+         profiler.export()
      pygame.quit()
      sys.exit()
 
- # --- Animation Helper Function ---
-def start_animation(piece, start_pos, end_pos):
-    global animating, animation_start_time, animation_piece, animation_start_pos, animation_end_pos
-    animating = True
-    animation_start_time = time.time()
-    animation_piece = piece
-    animation_start_pos = start_pos
-    animation_end_pos = end_pos
-    print(f"Starting animation for {piece} from {start_pos} to {end_pos}")
-
-# --- Load Stockfish Engine ---
-# Define path relative to the script's location
-try:
-    script_dir = os.path.dirname(__file__) # Get directory of the current script
-    # Adjust the relative path to your Stockfish executable
-    # Go up one level from script dir, then into stockfish folder
-    engine_path_relative = os.path.join("stockfish", "stockfish-generic")#replace with real stockfish path
-    engine_path = os.path.join(script_dir, engine_path_relative)
-    # For different OS or paths, adjust engine_path accordingly
-    # Example for Linux: engine_path = os.path.join(script_dir, "stockfish", "stockfish")
-    # Example for specific user path (like your original):
-    # engine_path = "C:\\Users\\blake\\Documents\\ChessApp\\stockfish\\stockfish-windows-x86-64-avx2.exe"
-
-    print(f"Attempting to load engine from: {engine_path}")
-    # Make sure the path exists before trying to open
-    if not os.path.exists(engine_path):
-         raise FileNotFoundError(f"Engine executable not found at resolved path: {engine_path}")
-
-    engine = chess.engine.SimpleEngine.popen_uci(engine_path)
-    # Engine is loaded, but difficulty will be configured later via menu
-    print("Stockfish engine loaded successfully.")
-except FileNotFoundError as e:
-    print(f"Error: Stockfish engine not found. {e}")
-    print("Please ensure Stockfish is installed and the path in the script is correct.")
-    engine = None # Set engine to None so the game knows it's unavailable
-except chess.engine.EngineError as e:
-    print(f"Error initializing Stockfish engine: {e}")
-    engine = None
-except Exception as e:
-    print(f"An unexpected error occurred loading the engine: {e}")
-    engine = None
+# --- Animation ---
+def ease_in_out_cubic(t):
+    return 4 * t * t * t if t < 0.5 else 1 - (-2 * t + 2) ** 3 / 2
+
+def ease_out_quad(t):
+    return 1 - (1 - t) * (1 - t)
+
+class Tween:
+    """Moves (or fades out) one piece sprite between board-relative positions over `duration`.
+
+    Everything is computed from time.monotonic() at draw time, so the animation looks the
+    same however often the loop happens to draw it. `square` is the board square the piece
+    is hidden on while the tween runs (None if it isn't on the board anymore).
+    """
+
+    def __init__(self, piece, square, start_pos, end_pos, duration=ANIMATION_DURATION, easing=ease_in_out_cubic, fade_out=False):
+        self.piece = piece
+        self.square = square
+        self.start_pos = start_pos
+        self.end_pos = end_pos
+        self.duration = duration
+        self.easing = easing
+        self.fade_out = fade_out
+        self.start_time = time.monotonic()
+
+    def progress(self, now):
+        return self.easing(min(max((now - self.start_time) / self.duration, 0), 1))
+
+    def pos(self, now):
+        t = self.progress(now)
+        return (round(self.start_pos[0] + (self.end_pos[0] - self.start_pos[0]) * t),
+                round(self.start_pos[1] + (self.end_pos[1] - self.start_pos[1]) * t))
+
+    def alpha(self, now):
+        return round(255 * (1 - self.progress(now))) if self.fade_out else 255
+
+    def rect(self, now, square_size):
+        return pygame.Rect(self.pos(now), (square_size, square_size))
+
+    def is_done(self, now):
+        return now - self.start_time >= self.duration
+
+def is_animating():
+    return bool(tweens)
+
+def update_tweens():
+    # Drops finished tweens; True if any finished (their pieces must be drawn at rest)
+    now = time.monotonic()
+    running = [tween for tween in tweens if not tween.is_done(now)]
+    finished = len(running) != len(tweens)
+    tweens[:] = running
+    return finished
+
+def get_hidden_squares():
+    return {tween.square for tween in tweens if tween.square is not None}
+
+def animate_move(move, board_before):
+    # Tweens for everything the move changes on the board: the piece itself, the rook when
+    # castling, and a captured piece (also the pawn taken en passant) fading out
+    square_size = INITIAL_SQUARE_SIZE
+    def square_pos(square):
+        return get_square_rect(square, square_size).topleft
+
+    piece = board_before.piece_at(move.from_square)
+    if piece is None:
+        return
+    if board_before.is_castling(move):
+        rank = chess.square_rank(move.from_square)
+        if chess.square_file(move.to_square) > chess.square_file(move.from_square): # King side
+            rook_from, rook_to = chess.square(7, rank), chess.square(5, rank)
+        else:
+            rook_from, rook_to = chess.square(0, rank), chess.square(3, rank)
+        rook = board_before.piece_at(rook_from)
+        if rook:
+            tweens.append(Tween(rook, rook_to, square_pos(rook_from), square_pos(rook_to)))
+    else:
+        if board_before.is_en_passant(move):
+            captured_square = chess.square(chess.square_file(move.to_square), chess.square_rank(move.from_square))
+        else:
+            captured_square = move.to_square
+        captured = board_before.piece_at(captured_square)
+        if captured:
+            # Not on the board anymore; drawn first so the capturing piece slides over it
+            tweens.append(Tween(captured, None, square_pos(captured_square), square_pos(captured_square), easing=ease_out_quad, fade_out=True))
+    # The moving piece is drawn as it was before the move (a promoting pawn turns into the new piece on arrival)
+    tweens.append(Tween(piece, move.to_square, square_pos(move.from_square), square_pos(move.to_square)))
+    logger.debug("Starting animation for %s (%s tweens)", move, len(tweens))
+
+def on_session_move(move, board_before):
+    # GameSession.on_move hook for the window: animate, and analyse the new position
+    animate_move(move, board_before)
+    if analysis:
+        analysis.start(session.board)
+
+def toggle_analysis():
+    global analysis
+    if analysis:
+        analysis.close()
+        engine_pool.release(analysis.worker)
+        analysis = None
+        if session:
+            session.update_engine_options() # The game engine gets the whole share back
+    else:
+        request_engines(("analysis",)) # Its own engine, so analysis never delays the opponent's moves
+    mark_full_redraw() # Panel and button appear/disappear
+
+def start_analysis(worker):
+    global analysis
+    options = get_engine_options(max(ENGINE_PROFILES), engine_pool.engine_count()) # Full strength, fair share of the machine
+    options["MultiPV"] = ANALYSIS_MULTIPV
+    analysis = LiveAnalysis(worker, options)
+    analysis.start(session.board)
+    session.update_engine_options() # Now shares the machine with the analysis engine
+    mark_full_redraw()
+
+def stop_animation():
+    tweens.clear()
+
+def request_engines(purpose, count=1):
+    # Leases engines on a background thread, as starting one takes a moment; they come back with
+    # ENGINE_LEASE_EVENT and handle_engine_lease() puts them to use for `purpose`
+    global engine_request
+    if engine_request is not None:
+        logger.info("Still waiting for an engine for %s.", engine_request[0])
+        return
+    engine_request = purpose
+    engine_pool.lease_async(count, on_done=lambda workers: pygame.event.post(pygame.event.Event(ENGINE_LEASE_EVENT, workers=workers)))
+
+def handle_engine_lease(workers):
+    global engine_request, resumed_game
+    purpose, engine_request = engine_request, None
+    if not workers:
+        logger.warning("Cannot start %s - No engine available.", purpose[0])
+    elif purpose[0] == "game" and game_state == MENU:
+        start_game(purpose[1], workers[0])
+    elif purpose[0] == "resume" and game_state == MENU:
+        resume_journal_game(purpose[1], purpose[2], workers[0])
+    elif purpose[0] == "resume":
+        resumed_game = purpose[1:] # Offered again the next time the menu is shown
+        for worker in workers:
+            engine_pool.release(worker)
+    elif purpose[0] == "simul" and game_state == MENU:
+        start_simul(workers)
+    elif purpose[0] == "analysis" and game_state == PLAYING and analysis is None:
+        start_analysis(workers[0])
+    else:
+        for worker in workers: # The screen has changed since they were asked for
+            engine_pool.release(worker)
+
+def start_game(skill, worker):
+    global session, game_state
+    logger.info("Selected difficulty: %s", skill)
+    if session:
+        session.close() # Hands its engine back to the pool
+    session = GameSession(engine_difficulty=skill, worker=worker, on_move=on_session_move, pool=engine_pool, journal=game_journal) # Fresh board for the new game
+    game_state = PLAYING
+    load_and_scale_images(INITIAL_SQUARE_SIZE)
+    stop_animation()
+    if analysis:
+        analysis.start(session.board)
+    mark_full_redraw()
+
+def resume_pending_game():
+    # Called while the menu is shown: an unfinished game from the journal is continued as soon
+    # as an engine can be had, before a new game could replace it in the journal
+    global resumed_game
+    if resumed_game and engine_request is None and engine_pool.is_ready():
+        request_engines(("resume", *resumed_game))
+        resumed_game = None
+
+def leave_game():
+    # Playing screen -> menu. An unfinished game stays in the journal until the next game starts.
+    global session, game_state
+    if analysis:
+        toggle_analysis() # Hands its engine back
+    if session:
+        session.close()
+        session = None
+    stop_animation()
+    game_state = MENU
+
+def resume_journal_game(skill, moves, worker):
+    # Replays an unfinished game from the journal and continues it
+    global session, game_state
+    new_session = GameSession(engine_difficulty=skill, worker=worker, pool=engine_pool)
+    for move in moves:
+        new_session.push_move(move) # Not journaled again: the journal is attached afterwards
+    new_session.is_player_move = new_session.board.turn == chess.WHITE
+    white_moves = new_session.board.move_stack[::2]
+    new_session.last_player_move = white_moves[-1] if white_moves else None
+    new_session.game_over_text = new_session.check_game_over()
+    new_session.on_move = on_session_move
+    new_session.journal = game_journal
+    game_journal.resume_game(skill, moves)
+    if new_session.game_over_text:
+        new_session.finish_journal() # Process died before the end of the game was recorded
+    if session:
+        session.close()
+    session = new_session
+    game_state = PLAYING
+    load_and_scale_images(INITIAL_SQUARE_SIZE)
+    mark_full_redraw()
+    logger.info("Resumed unfinished game from the journal: skill %s, %s moves.", skill, len(moves))
+
+# --- Simul ---
+# SIMUL_BOARDS games against the engine tiled in one window. The boards share the sprite and
+# text caches and SIMUL_ENGINES engines from the pool: every board is assigned to one of the
+# engines and its searches queue up on that engine's worker with those of the other boards.
+def get_simul_layout(count):
+    # (square size, tile rect per board) for `count` boards in a grid above the button bar
+    cols = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / cols)
+    tile_size = min(screen_width // cols, (screen_height - BUTTON_HEIGHT - 2 * BUTTON_MARGIN) // rows)
+    square_size = (tile_size - SIMUL_LABEL_HEIGHT - BUTTON_MARGIN) // 8
+    grid_x = (screen_width - cols * tile_size) // 2 # Center horizontally
+    tiles = [pygame.Rect(grid_x + (i % cols) * tile_size, (i // cols) * tile_size, tile_size, tile_size) for i in range(count)]
+    return square_size, tiles
+
+def get_simul_board_origin(tile, square_size):
+    return (tile.x + (tile.width - 8 * square_size) // 2, tile.y + BUTTON_MARGIN // 2)
+
+def get_simul_button_rects():
+    # (menu button, quit button) in the bar under the boards
+    menu_rect = pygame.Rect(BUTTON_MARGIN, screen_height - BUTTON_HEIGHT - BUTTON_MARGIN, BUTTON_WIDTH, BUTTON_HEIGHT)
+    quit_rect = pygame.Rect(screen_width - BUTTON_WIDTH - BUTTON_MARGIN, screen_height - BUTTON_HEIGHT - BUTTON_MARGIN, BUTTON_WIDTH, BUTTON_HEIGHT)
+    return menu_rect, quit_rect
+
+def start_simul(workers):
+    # workers: the engines leased for the simul (up to SIMUL_ENGINES)
+    global game_state
+    simul_workers.extend(workers)
+    game_keys = [object() for _ in simul_workers] # One per engine, so the boards on it keep its hash table
+    for i in range(SIMUL_BOARDS):
+        # No ponder searches and no clock: each board waits for the others' searches on its engine
+        worker_index = i % len(simul_workers)
+        game = GameSession(engine_difficulty=SIMUL_SKILL, worker=simul_workers[worker_index], ponder=False, game_time=None, game_key=game_keys[worker_index])
+        game.engine_options = get_engine_options(SIMUL_SKILL, len(simul_workers)) # Cores and memory split between the shared engines
+        simul_sessions.append(game)
+    logger.info("Simul started: %s boards, %s engines.", SIMUL_BOARDS, len(simul_workers))
+    load_and_scale_images(get_simul_layout(SIMUL_BOARDS)[0])
+    game_state = SIMUL
+    mark_full_redraw()
+
+def stop_simul():
+    for game in simul_sessions:
+        game.close() # Cancels its searches; the shared workers stay up
+    simul_sessions.clear()
+    for worker in simul_workers:
+        engine_pool.release(worker)
+    simul_workers.clear()
+    simul_drawn.clear()
+
+def handle_simul_click(pos):
+    square_size, tiles = get_simul_layout(len(simul_sessions))
+    for game, tile in zip(simul_sessions, tiles):
+        if not tile.collidepoint(pos):
+            continue
+        if game.is_player_move and not game.game_over_text:
+            clicked_square_name = get_square_from_pos(pos, square_size, get_simul_board_origin(tile, square_size))
+            if clicked_square_name:
+                game.handle_board_click(clicked_square_name)
+                if game.promotion_move:
+                    game.handle_promotion_click('q') # No room for the promotion panel on the small boards
+        return
+
+def update_simul():
+    # Starts or collects the engine's reply on every board where it is the engine's turn.
+    # Returns True if a move was played.
+    moved = False
+    for game in simul_sessions:
+        if game.is_engine_turn():
+            if game.engine_searching:
+                moved = game.poll_engine_move() or moved
+            else:
+                game.make_engine_move()
+    return moved
+
+def draw_simul_screen(surface, menu_button_rect, quit_button_rect):
+    # Returns the screen rects that changed, or None if the whole screen was redrawn.
+    # Each board is drawn into a subsurface of the window, and only when it changed.
+    global full_redraw
+    square_size, tiles = get_simul_layout(len(simul_sessions))
+    redraw_all = full_redraw
+    if redraw_all:
+        surface.fill((200, 200, 200)) # Background color
+        simul_drawn.clear()
+        create_button(surface, "Menu", menu_button_rect, BUTTON_COLOR, BUTTON_TEXT_COLOR, font)
+        create_button(surface, "Quit", quit_button_rect, (200, 50, 50), BUTTON_TEXT_COLOR, font)
+    dirty_rects = []
+    for i, (game, tile) in enumerate(zip(simul_sessions, tiles)):
+        status = game.game_over_text or ("Your move" if game.is_player_move else "Engine thinking...")
+        state = (game.board.ply(), game.selected_square, status)
+        if simul_drawn.get(i) == state:
+            continue
+        simul_drawn[i] = state
+        surface.fill((200, 200, 200), tile)
+        board_origin = get_simul_board_origin(tile, square_size)
+        board_surface = surface.subsurface((board_origin[0], board_origin[1], 8 * square_size, 8 * square_size))
+        draw_board(board_surface, square_size)
+        highlight_squares(board_surface, square_size, get_highlights(game))
+        draw_pieces(board_surface, game.board, square_size)
+        label = render_text(info_font, f"Board {i + 1}: {status}", (0, 0, 0))
+        surface.blit(label, label.get_rect(midtop=(tile.centerx, board_origin[1] + 8 * square_size + 4)))
+        dirty_rects.append(tile)
+    full_redraw = False
+    return None if redraw_all else dirty_rects
+
+# --- Database Browser ---
+# The games in DATABASE_PATH (filled by ChessDatabase.py) as an opening tree: moves are played
+# on the board or picked from the list of moves played from the position, which shows how
+# often each was played and how those games ended. Under the board are the newest games that
+# reached the position; clicking one prints it to the terminal. The database is only used from
+# the browser's query thread, which answers with DATABASE_QUERY_EVENT, so a slow lookup never
+# holds up a frame.
+class DatabaseBrowser:
+    def __init__(self, path=DATABASE_PATH):
+        self.path = path
+        self.board = chess.Board()
+        self.selected_square = None # Same selection fields as GameSession, for get_highlights()
+        self.legal_destinations = {} # from square -> bitboard of destination squares
+        self.stats = [] # [(move, games, white wins, draws, black wins)] from the database
+        self.total = 0 # Games through the position
+        self.games = [] # [(game id, white, black, result, date, ply)]
+        self.query_time = 0.0
+        self.query_id = 0 # Newest lookup asked for; older answers are dropped
+        self.loading = False # True until the answer to the newest lookup is in
+        self.error = None # Why the database can't be used, if it can't
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="database-query", daemon=True)
+        self.thread.start()
+
+    def refresh(self):
+        # Looks up the current position; called after every change of it
+        self.query_id += 1
+        self.loading = True
+        self.stats = [] # They belong to the previous position
+        self.games = []
+        self.selected_square = None
+        self.legal_destinations.clear()
+        self.requests.put(("lookup", self.query_id, self.board.copy(stack=False)))
+
+    def apply_result(self, event):
+        # DATABASE_QUERY_EVENT handler, on the UI thread
+        if event.error:
+            self.error = event.error
+            self.loading = False
+        elif event.query_id == self.query_id:
+            self.stats, self.total, self.games, self.query_time = event.stats, event.total, event.games, event.query_time
+            self.loading = False
+
+    def print_game(self, game_id):
+        self.requests.put(("game", game_id))
+
+    def close(self):
+        self.requests.put(None)
+        self.thread.join(timeout=5)
+
+    def run(self):
+        # Query thread: owns the SQLite connection
+        try:
+            database = GameDatabase(self.path)
+        except sqlite3.Error as e:
+            logger.error("Cannot open the game database %s: %s", self.path, e)
+            pygame.event.post(pygame.event.Event(DATABASE_QUERY_EVENT, error=f"Cannot open the game database: {e}"))
+            return
+        try:
+            while True:
+                request = self.requests.get()
+                if request is None:
+                    break
+                try:
+                    if request[0] == "game":
+                        logger.info("Game #%s:\n%s", request[1], database.get_game(request[1]))
+                    elif request[1] == self.query_id: # Skips positions already left again
+                        _, query_id, board = request
+                        start_time = time.perf_counter()
+                        stats = database.move_stats(board)
+                        total = database.count_games_through(board)
+                        games = database.games_through(board, DATABASE_GAMES_SHOWN)
+                        query_time = time.perf_counter() - start_time
+                        logger.debug("Database lookup: %s games, %s moves in %.1f ms.", total, len(stats), query_time * 1000)
+                        pygame.event.post(pygame.event.Event(DATABASE_QUERY_EVENT, error=None, query_id=query_id, stats=stats, total=total, games=games, query_time=query_time))
+                except sqlite3.Error as e:
+                    logger.error("Database lookup failed: %s", e)
+                    pygame.event.post(pygame.event.Event(DATABASE_QUERY_EVENT, error=f"Database lookup failed: {e}"))
+        finally:
+            database.close()
+
+    def play(self, move):
+        self.board.push(move)
+        self.refresh()
+
+    def back(self):
+        if self.board.move_stack:
+            self.board.pop()
+            self.refresh()
+
+    def reset(self):
+        self.board.reset()
+        self.refresh()
+
+    def handle_board_click(self, square_name):
+        square = chess.parse_square(square_name)
+        if self.selected_square:
+            from_square = chess.parse_square(self.selected_square)
+            for move in self.board.legal_moves:
+                if move.from_square == from_square and move.to_square == square and move.promotion in (None, chess.QUEEN):
+                    self.play(move) # Promotes to a queen; other promotions can be picked from the list
+                    return
+        piece = self.board.piece_at(square)
+        self.legal_destinations.clear()
+        if piece and piece.color == self.board.turn and square_name != self.selected_square:
+            self.selected_square = square_name
+            for move in self.board.legal_moves:
+                if move.from_square == square:
+                    self.legal_destinations[square] = self.legal_destinations.get(square, 0) | chess.BB_SQUARES[move.to_square]
+        else:
+            self.selected_square = None
+
+def open_database_browser():
+    global database_browser
+    if database_browser is None:
+        database_browser = DatabaseBrowser(DATABASE_PATH)
+    database_browser.refresh() # Games may have been added since the last visit
+    load_and_scale_images(DATABASE_SQUARE_SIZE)
+    return True
+
+def get_database_layout():
+    # (board origin, move statistics rect, game list rect)
+    board_size = 8 * DATABASE_SQUARE_SIZE
+    stats_rect = pygame.Rect(board_size + 2 * BUTTON_MARGIN, BUTTON_MARGIN, screen_width - board_size - 3 * BUTTON_MARGIN, board_size)
+    games_rect = pygame.Rect(BUTTON_MARGIN, board_size + 2 * BUTTON_MARGIN, screen_width - 2 * BUTTON_MARGIN, screen_height - board_size - 4 * BUTTON_MARGIN - BUTTON_HEIGHT)
+    return (BUTTON_MARGIN, BUTTON_MARGIN), stats_rect, games_rect
+
+def get_database_button_rects():
+    # (back, reset, menu, quit) in the bar at the bottom
+    y = screen_height - BUTTON_HEIGHT - BUTTON_MARGIN
+    back_rect, reset_rect, menu_rect = (pygame.Rect(BUTTON_MARGIN + i * (BUTTON_WIDTH + BUTTON_MARGIN), y, BUTTON_WIDTH, BUTTON_HEIGHT) for i in range(3))
+    quit_rect = pygame.Rect(screen_width - BUTTON_WIDTH - BUTTON_MARGIN, y, BUTTON_WIDTH, BUTTON_HEIGHT)
+    return back_rect, reset_rect, menu_rect, quit_rect
+
+def get_database_row_rect(panel_rect, index):
+    # Row `index` of a panel; row 0 is the panel's heading
+    return pygame.Rect(panel_rect.left, panel_rect.top + (index + 1) * DATABASE_ROW_HEIGHT, panel_rect.width, DATABASE_ROW_HEIGHT)
+
+def get_database_row_count(panel_rect):
+    return panel_rect.height // DATABASE_ROW_HEIGHT - 1
+
+def handle_database_click(pos):
+    board_origin, stats_rect, games_rect = get_database_layout()
+    clicked_square_name = get_square_from_pos(pos, DATABASE_SQUARE_SIZE, board_origin)
+    if clicked_square_name:
+        database_browser.handle_board_click(clicked_square_name)
+        return
+    for i, (move, *_) in enumerate(database_browser.stats[:get_database_row_count(stats_rect)]):
+        if get_database_row_rect(stats_rect, i).collidepoint(pos):
+            database_browser.play(move)
+            return
+    for i, (game_id, *_) in enumerate(database_browser.games[:get_database_row_count(games_rect)]):
+        if get_database_row_rect(games_rect, i).collidepoint(pos):
+            database_browser.print_game(game_id)
+            return
+
+def draw_database_screen(surface, browser):
+    # Always a full redraw; the screen only changes on clicks
+    board_origin, stats_rect, games_rect = get_database_layout()
+    surface.fill((200, 200, 200)) # Background color
+    board_size = 8 * DATABASE_SQUARE_SIZE
+    board_surface = surface.subsurface((board_origin[0], board_origin[1], board_size, board_size))
+    draw_board(board_surface, DATABASE_SQUARE_SIZE)
+    highlight_squares(board_surface, DATABASE_SQUARE_SIZE, get_highlights(browser))
+    draw_pieces(board_surface, browser.board, DATABASE_SQUARE_SIZE)
+
+    # Move statistics: move, games, and a bar split into white wins / draws / black wins
+    pygame.draw.rect(surface, (235, 235, 235), stats_rect)
+    if browser.error:
+        heading = browser.error
+    elif browser.loading:
+        heading = "Looking up the position\u2026"
+    else:
+        heading = f"{browser.total} games through this position ({browser.query_time * 1000:.1f} ms)"
+    surface.blit(info_font.render(heading, True, (0, 0, 120)), (stats_rect.left + 10, stats_rect.top + 6))
+    bar_left = stats_rect.left + 150
+    bar_width = stats_rect.right - 10 - bar_left
+    for i, (move, games, white, draws, black) in enumerate(browser.stats[:get_database_row_count(stats_rect)]):
+        row_rect = get_database_row_rect(stats_rect, i)
+        surface.blit(render_text(info_font, browser.board.san(move), (0, 0, 0)), (row_rect.left + 10, row_rect.top + 6))
+        games_text = info_font.render(str(games), True, (0, 0, 0))
+        surface.blit(games_text, games_text.get_rect(right=bar_left - 10, top=row_rect.top + 6))
+        x = bar_left
+        for count, color in ((white, (250, 250, 250)), (draws, (150, 150, 150)), (black, (40, 40, 40))):
+            width = bar_width * count // games
+            pygame.draw.rect(surface, color, (x, row_rect.top + 4, width, DATABASE_ROW_HEIGHT - 8))
+            x += width
+        percent_text = info_font.render(f"{white * 100 // games}% / {draws * 100 // games}% / {black * 100 // games}%", True, (200, 0, 0))
+        surface.blit(percent_text, percent_text.get_rect(center=(bar_left + bar_width // 2, row_rect.centery)))
+    if browser.total == 0 and not (browser.loading or browser.error):
+        hint = "No games in the database yet. To add the finished games, run:" if not browser.board.move_stack else "No games reached this position."
+        surface.blit(render_text(info_font, hint, (200, 0, 0)), get_database_row_rect(stats_rect, 0).move(10, 6))
+        if not browser.board.move_stack:
+            command = "python ChessDatabase.py ingest games/archive.pgn"
+            surface.blit(render_text(info_font, command, (0, 0, 0)), get_database_row_rect(stats_rect, 1).move(10, 6))
+
+    # Newest games through the position
+    pygame.draw.rect(surface, (235, 235, 235), games_rect)
+    surface.blit(render_text(info_font, "Games (click to print the moves)", (0, 0, 120)), (games_rect.left + 10, games_rect.top + 6))
+    for i, (game_id, white_name, black_name, result, date, ply) in enumerate(browser.games[:get_database_row_count(games_rect)]):
+        row_rect = get_database_row_rect(games_rect, i)
+        text = f"#{game_id}  {white_name} - {black_name}  {result}  {date}  (reached on move {ply // 2 + 1})"
+        surface.blit(info_font.render(text, True, (0, 0, 0)), (row_rect.left + 10, row_rect.top + 6))
+
+    back_rect, reset_rect, menu_rect, quit_rect = get_database_button_rects()
+    create_button(surface, "Back", back_rect, BUTTON_COLOR, BUTTON_TEXT_COLOR, font)
+    create_button(surface, "Reset", reset_rect, BUTTON_COLOR, BUTTON_TEXT_COLOR, font)
+    create_button(surface, "Menu", menu_rect, BUTTON_COLOR, BUTTON_TEXT_COLOR, font)
+    create_button(surface, "Quit", quit_rect, (200, 50, 50), BUTTON_TEXT_COLOR, font)
 
 # --- Menu Drawing Function ---
 def draw_menu(surface):
@@ -536,7 +2293,7 @@ def draw_menu(surface):
     menu_buttons.clear() # Clear previous buttons if screen resized
 
     # Title
-    title_text = menu_title_font.render("Select Difficulty", True, (0, 0, 50))
+    title_text = render_text(menu_title_font, "Select Difficulty", (0, 0, 50))
     title_rect = title_text.get_rect(center=(surface.get_width() // 2, surface.get_height() // 4))
     surface.blit(title_text, title_rect)
 
@@ -550,10 +2307,30 @@ def draw_menu(surface):
         create_button(surface, label, button_rect, BUTTON_COLOR, BUTTON_TEXT_COLOR, menu_button_font)
         menu_buttons[skill] = button_rect # Store rect keyed by skill level
 
-    # Display engine status
-    engine_status = "Engine: Ready" if engine else "Engine: Not Found/Error"
-    status_color = (0, 150, 0) if engine else (200, 0, 0)
-    status_text = info_font.render(engine_status, True, status_color)
+    # Simul below the difficulties
+    simul_rect = pygame.Rect(button_x, button_y_start + len(difficulties) * (MENU_BUTTON_HEIGHT + BUTTON_MARGIN), MENU_BUTTON_WIDTH, MENU_BUTTON_HEIGHT)
+    create_button(surface, f"Simul x{SIMUL_BOARDS}", simul_rect, (70, 110, 170), BUTTON_TEXT_COLOR, menu_button_font)
+    menu_buttons['simul'] = simul_rect
+
+    # Game database below the simul
+    database_rect = simul_rect.move(0, MENU_BUTTON_HEIGHT + BUTTON_MARGIN)
+    create_button(surface, "Database", database_rect, (120, 90, 160), BUTTON_TEXT_COLOR, menu_button_font)
+    menu_buttons['database'] = database_rect
+
+    # Display engine status (redrawn when the engine started in the background is ready)
+    status = engine_pool.status() if engine_pool is not None else "error"
+    if status == "ready" and engine_request is not None:
+        status = "starting" # An engine for the button just clicked is on its way
+    if status == "ready": # Settings each difficulty would start with on this machine
+        engine_status = "Engine: Ready  (threads/hash) " + "  ".join(f"{label} {describe_engine_options(get_engine_options(skill))}" for label, skill in difficulties.items())
+        status_color = (0, 150, 0)
+    elif status == "starting":
+        engine_status = "Engine: Starting\u2026"
+        status_color = (180, 120, 0)
+    else:
+        engine_status = "Engine: Not Found/Error"
+        status_color = (200, 0, 0)
+    status_text = render_text(info_font, engine_status, status_color)
     status_rect = status_text.get_rect(center=(surface.get_width() // 2, surface.get_height() * 0.85))
     surface.blit(status_text, status_rect)
 
@@ -562,126 +2339,358 @@ def draw_menu(surface):
     create_button(surface, "Quit", quit_rect, (200, 50, 50), BUTTON_TEXT_COLOR, font) # Use smaller font
     menu_buttons['quit'] = quit_rect # Add quit button to clickable items
 
+# --- Dirty-Rectangle Renderer ---
+# Remembers what is currently on screen so that each frame only repaints the squares whose
+# piece or highlight changed (plus the area under a moving piece) and the info panel when
+# its text changed. Everything else stays as it was drawn on the last full redraw.
+drawn_squares = {} # square -> (piece, highlight) as currently shown
+drawn_tween_rects = [] # Board-relative rects of the tweened pieces last frame
+drawn_panel = None # (turn, last move, game over text, promotion panel shown, tablebase result)
+drawn_analysis_version = None # LiveAnalysis.version currently shown
+drawn_analysis_time = 0 # When the analysis panel was last drawn
+full_redraw = True
+
+def mark_full_redraw():
+    global full_redraw
+    full_redraw = True
+
+def get_playing_layout():
+    # draw_playing_screen's layout arguments: (board origin, board size, info panel, second
+    # info panel, analysis panel, restart button, quit button, analysis button, menu button)
+    board_size = 8 * INITIAL_SQUARE_SIZE # Use initial square size for fixed board size
+    board_x = (screen_width - board_size) // 2  # Center horizontally
+    board_y = (screen_height - INFO_PANEL_HEIGHT - board_size) // 2 # Center board vertically above info panel
+    info_panel_rect = pygame.Rect(0, board_y + board_size, screen_width, INFO_PANEL_HEIGHT)
+    info_panel_rect2 = pygame.Rect(0, board_size, screen_width, INFO_PANEL_HEIGHT)
+    analysis_panel_rect = pygame.Rect(0, info_panel_rect.bottom, screen_width, ANALYSIS_PANEL_HEIGHT)
+    button_y = screen_height - BUTTON_HEIGHT - BUTTON_MARGIN
+    restart_button_rect = pygame.Rect((screen_width - BUTTON_WIDTH) // 2, button_y, BUTTON_WIDTH, BUTTON_HEIGHT)
+    quit_button_rect = pygame.Rect(screen_width - BUTTON_WIDTH - BUTTON_MARGIN, button_y, BUTTON_WIDTH, BUTTON_HEIGHT)
+    analysis_button_rect = pygame.Rect(BUTTON_MARGIN, button_y, BUTTON_WIDTH, BUTTON_HEIGHT)
+    menu_button_rect = analysis_button_rect.move(BUTTON_WIDTH + BUTTON_MARGIN, 0)
+    return ((board_x, board_y), board_size, info_panel_rect, info_panel_rect2, analysis_panel_rect,
+            restart_button_rect, quit_button_rect, analysis_button_rect, menu_button_rect)
+
+def draw_playing_screen(surface, session, board_origin, board_size, info_panel_rect, info_panel_rect2, analysis_panel_rect, restart_button_rect, quit_button_rect, analysis_button_rect, menu_button_rect):
+    # Returns the screen rects that changed, or None if the whole screen was redrawn
+    global drawn_squares, drawn_tween_rects, drawn_panel, drawn_analysis_version, drawn_analysis_time, full_redraw
+    board = session.board
+    board_surface = surface.subsurface((board_origin[0], board_origin[1], board_size, board_size))
+    highlights = get_highlights(session)
+    piece_map = board.piece_map()
+    hidden_squares = get_hidden_squares()
+    for square in hidden_squares:
+        piece_map.pop(square, None)
+    squares = {square: (piece_map.get(square), highlights.get(square)) for square in chess.SQUARES}
+    now = time.monotonic()
+    tween_rects = [tween.rect(now, INITIAL_SQUARE_SIZE) for tween in tweens]
+    show_promotion = bool(session.promotion_move and session.is_player_move and not is_animating())
+    panel = (session.is_player_move, session.last_player_move, session.game_over_text, show_promotion, session.tablebase_result)
+    analysis_version, analysis_header, analysis_lines = analysis.snapshot() if analysis else (None, None, None)
+
+    dirty = set()
+    if drawn_panel is None or panel[2:4] != drawn_panel[2:4]:
+        full_redraw = True # Game over text and promotion panel overlap the board
+    if not full_redraw:
+        dirty = {square for square, state in squares.items() if drawn_squares.get(square) != state}
+        for rect in drawn_tween_rects + tween_rects:
+            dirty.update(get_squares_in_rect(rect, INITIAL_SQUARE_SIZE))
+        if dirty and (session.game_over_text or show_promotion):
+            full_redraw = True
+
+    if full_redraw:
+        surface.fill((200, 200, 200)) # Background color
+        with profiler.span("draw_board"):
+            draw_board(board_surface, INITIAL_SQUARE_SIZE)
+        with profiler.span("highlight_squares"):
+            highlight_squares(board_surface, INITIAL_SQUARE_SIZE, highlights)
+        with profiler.span("draw_pieces"):
+            draw_pieces(board_surface, board, INITIAL_SQUARE_SIZE, hidden_squares)
+            draw_tweens(board_surface, INITIAL_SQUARE_SIZE, now)
+        draw_info_panel(surface, session.game_over_text, session.is_player_move, info_panel_rect, info_panel_rect2, session.last_player_move, session.tablebase_result)
+        if show_promotion:
+            draw_promotion_panel(surface, board_origin, INITIAL_SQUARE_SIZE)
+        create_button(surface, "Restart", restart_button_rect, BUTTON_COLOR, BUTTON_TEXT_COLOR, font)
+        create_button(surface, "Quit", quit_button_rect, (200, 50, 50), BUTTON_TEXT_COLOR, font)
+        create_button(surface, "Analysis", analysis_button_rect, BUTTON_COLOR if analysis else (130, 130, 130), BUTTON_TEXT_COLOR, font)
+        create_button(surface, "Menu", menu_button_rect, BUTTON_COLOR, BUTTON_TEXT_COLOR, font)
+        if analysis:
+            draw_analysis_panel(surface, analysis_panel_rect, analysis_header, analysis_lines)
+            drawn_analysis_version, drawn_analysis_time = analysis_version, time.time()
+        else:
+            drawn_analysis_version = None # Nothing shown; the panel area is background again
+        dirty_rects = None
+    else:
+        dirty_rects = []
+        if dirty:
+            dirty_squares = sorted(dirty)
+            with profiler.span("draw_board"):
+                draw_board(board_surface, INITIAL_SQUARE_SIZE, dirty_squares)
+            with profiler.span("highlight_squares"):
+                highlight_squares(board_surface, INITIAL_SQUARE_SIZE, highlights, dirty_squares)
+            with profiler.span("draw_pieces"):
+                draw_pieces(board_surface, board, INITIAL_SQUARE_SIZE, hidden_squares, dirty_squares)
+                draw_tweens(board_surface, INITIAL_SQUARE_SIZE, now) # Their squares are all dirty, so this only covers repainted areas
+            dirty_rects.extend(get_square_rect(square, INITIAL_SQUARE_SIZE).move(board_origin) for square in dirty_squares)
+        if panel != drawn_panel:
+            draw_info_panel(surface, session.game_over_text, session.is_player_move, info_panel_rect, info_panel_rect2, session.last_player_move, session.tablebase_result)
+            dirty_rects.append(info_panel_rect)
+        # New engine output is shown at most every ANALYSIS_REFRESH_INTERVAL, however fast it arrives
+        if analysis_lines is not None and analysis_version != drawn_analysis_version and time.time() - drawn_analysis_time >= ANALYSIS_REFRESH_INTERVAL:
+            draw_analysis_panel(surface, analysis_panel_rect, analysis_header, analysis_lines)
+            dirty_rects.append(analysis_panel_rect)
+            drawn_analysis_version, drawn_analysis_time = analysis_version, time.time()
+
+    drawn_squares = squares
+    drawn_tween_rects = tween_rects
+    drawn_panel = panel
+    full_redraw = False
+    return dirty_rects
+
+# --- Profiler Overlay ---
+profiler_overlay_time = 0 # When the overlay was last drawn
+
+def format_ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.1f}"
+
+def draw_profiler_overlay(surface, rect, session):
+    global profiler_overlay_time
+    profiler_overlay_time = time.time()
+    def p(name, pct=50):
+        return format_ms(profiler.percentile(name, pct))
+    lines = [
+        f"FPS {profiler.fps():.0f}   frame p50 {p('frame')}  p95 {p('frame', 95)}  p99 {p('frame', 99)} ms",
+        f"events {p('events')}   logic {p('logic')}   render {p('render')}   engine call {p('make_engine_move')} ms (p50)",
+        f"board {p('draw_board')}   highlights {p('highlight_squares')}   pieces {p('draw_pieces')} ms (p50)",
+    ]
+    if session:
+        info = session.last_engine_info
+        nps = info.get("nps")
+        latency = session.engine_move_times[-1] if session.engine_move_times else None
+        lines.append(f"engine depth {info.get('depth', '-')}   {nps // 1000 if nps else '-'} kN/s   "
+                     f"move latency {format_ms(latency)} ms (p50 {p('engine_move')} ms)")
+    pygame.draw.rect(surface, (30, 30, 30), rect)
+    y = rect.top + 4
+    for text in lines:
+        # Numbers change every refresh: rendered directly instead of through the text cache
+        surface.blit(info_font.render(text, True, (120, 255, 120)), (rect.left + 10, y))
+        y += info_font.get_linesize()
+
+def profiler_overlay_due():
+    return profiler.enabled and game_state == PLAYING and time.time() - profiler_overlay_time >= PROFILER_REFRESH_INTERVAL
+
+def toggle_profiler():
+    profiler.set_enabled(not profiler.enabled)
+    logger.info("Profiler %s (F3 toggles, F4 exports).", "on" if profiler.enabled else "off")
+    mark_full_redraw() # Overlay appears/disappears
+
+# --- Frame Pacing ---
+def is_busy():
+    # True while something changes on screen without user input (animation or engine turn).
+    # Only then do we render at FPS; otherwise the loop sleeps until an event arrives.
+    if game_state == SIMUL:
+        return any(game.is_engine_turn() for game in simul_sessions)
+    if game_state != PLAYING:
+        return False
+    if is_animating() or (analysis and analysis.is_running()):
+        return True
+    return session.is_engine_turn()
+
+def wait_for_events(busy):
+    if busy or needs_redraw:
+        return pygame.event.get()
+    # Board is static: block (without burning CPU) until input arrives or the timeout expires
+    event = pygame.event.wait(IDLE_WAIT_MS)
+    if event.type == pygame.NOEVENT:
+        return []
+    return [event] + pygame.event.get()
+
 # --- Game Loop ---
-running = True
-load_and_scale_images(INITIAL_SQUARE_SIZE) # Initial image scaling
-
-while running:
-    # --- Event Handling ---
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            quit_game()
-
-        if event.type == pygame.MOUSEBUTTONDOWN:
-            if event.button == 1: # Left click
-                click_pos = event.pos
-
-                if game_state == MENU:
-                    # Handle menu clicks
-                    for skill, rect in menu_buttons.items():
-                        if rect.collidepoint(click_pos):
-                            if skill == 'quit':
-                                quit_game()
-                            elif engine: # Only start if engine is loaded
-                                engine_difficulty = skill
-                                print(f"Selected difficulty: {skill}")
-                                try:
-                                    engine.configure({"Skill Level": engine_difficulty})
-                                    print(f"Engine Skill Level set to {engine_difficulty}")
-                                except Exception as e:
-                                    print(f"Error configuring engine: {e}")
-                                game_state = PLAYING
-                                restart_game() # Reset board for the new game
-                            else:
-                                print("Cannot start game - Engine not loaded.")
-                            break # Exit loop once a button is clicked
-
-                elif game_state == PLAYING:
-                    # --- Calculate layout for PLAYING state ---
-                    board_size = 8 * INITIAL_SQUARE_SIZE # Use initial square size for fixed board size
-                    board_x = (screen_width - board_size) // 2  # Center horizontally
-                    board_y = (screen_height - INFO_PANEL_HEIGHT - board_size) // 2 # Center board vertically above info panel
-                    board_origin = (board_x, board_y)
-                    info_panel_rect = pygame.Rect(0, board_y + board_size, screen_width, INFO_PANEL_HEIGHT)
-                    restart_button_rect = pygame.Rect((screen_width - BUTTON_WIDTH) // 2, screen_height - BUTTON_HEIGHT - BUTTON_MARGIN, BUTTON_WIDTH, BUTTON_HEIGHT)
-                    quit_button_rect = pygame.Rect(screen_width - BUTTON_WIDTH - BUTTON_MARGIN, screen_height - BUTTON_HEIGHT - BUTTON_MARGIN, BUTTON_WIDTH, BUTTON_HEIGHT)
-
-                    # --- Handle PLAYING state clicks ---
-                    if promotion_move and is_player_move and not animating:
-                        promo_buttons_data = draw_promotion_panel(screen, board_origin, INITIAL_SQUARE_SIZE)
-                        if handle_promotion_click(click_pos, promo_buttons_data):
-                            last_move = board.peek()
-                            start_animation(chess.square_name(last_move.from_square), get_pos_from_square(chess.square_name(last_move.from_square), INITIAL_SQUARE_SIZE, board_origin), get_pos_from_square(chess.square_name(last_move.to_square), INITIAL_SQUARE_SIZE, board_origin))
-
-                    elif is_player_move and not game_over_text and not animating:
-                        if board_origin[0] <= click_pos[0] < board_origin[0] + board_size and \
-                           board_origin[1] <= click_pos[1] < board_origin[1] + board_size:
-                            move_made = handle_board_click(click_pos, INITIAL_SQUARE_SIZE, board_origin)
-                            if move_made and board.peek():
-                                last_move = board.peek()
-                                start_animation(chess.square_name(last_move.from_square), get_pos_from_square(chess.square_name(last_move.from_square), INITIAL_SQUARE_SIZE, board_origin), get_pos_from_square(chess.square_name(last_move.to_square), INITIAL_SQUARE_SIZE, board_origin))
-
-                    # Check button clicks
-                    if restart_button_rect.collidepoint(click_pos):
-                        restart_game()
-                    elif quit_button_rect.collidepoint(click_pos):
-                        quit_game()
-
-    # --- Game Logic ---
-    if game_state == PLAYING:
-        # --- Calculate layout for PLAYING state ---
-        board_size = 8 * INITIAL_SQUARE_SIZE # Use initial square size for fixed board size
-        board_x = (screen_width - board_size) // 2  # Center horizontally
-        board_y = (screen_height - INFO_PANEL_HEIGHT - board_size) // 2 # Center board vertically above info panel
-        board_origin = (board_x, board_y)
-        info_panel_rect = pygame.Rect(0, board_y + board_size, screen_width, INFO_PANEL_HEIGHT)
-
-        if animating:
-            if time.time() - animation_start_time >= ANIMATION_DURATION:
-                animating = False
-                animation_piece = None
-                if not is_player_move and not board.is_game_over() and not promotion_move:
-                    make_engine_move()
-
-        elif not is_player_move and not board.is_game_over() and not animating and not promotion_move:
-            pygame.time.delay(int(0.2 * 1000))
-            make_engine_move()
-
-    # --- Drawing ---
-    screen.fill((200, 200, 200)) # Background color
-
-    if game_state == MENU:
-        draw_menu(screen)
-    elif game_state == PLAYING:
-        # --- Calculate layout for PLAYING state (again for drawing) ---
-        board_size = 8 * INITIAL_SQUARE_SIZE # Use initial square size for fixed board size
-        board_x = (screen_width - board_size) // 2  # Center horizontally
-        board_y = (screen_height - INFO_PANEL_HEIGHT - board_size) // 2 # Center board vertically above info panel
-        board_origin = (board_x, board_y)
-        info_panel_rect = pygame.Rect(0, board_y + board_size, screen_width, INFO_PANEL_HEIGHT)
-        info_panel_rect2 = pygame.Rect(0, board_size, screen_width, INFO_PANEL_HEIGHT)
-        restart_button_rect = pygame.Rect((screen_width - BUTTON_WIDTH) // 2, screen_height - BUTTON_HEIGHT - BUTTON_MARGIN, BUTTON_WIDTH, BUTTON_HEIGHT)
-        quit_button_rect = pygame.Rect(screen_width - BUTTON_WIDTH - BUTTON_MARGIN, screen_height - BUTTON_HEIGHT - BUTTON_MARGIN, BUTTON_WIDTH, BUTTON_HEIGHT)
-
-        # Draw the board at the calculated board_origin
-        draw_board(screen.subsurface((board_origin[0], board_origin[1], board_size, board_size)), INITIAL_SQUARE_SIZE)
-
-        # Highlight squares also needs to be drawn on the board's surface
-        highlight_surface = pygame.Surface((board_size, board_size), pygame.SRCALPHA)
-        highlight_squares(highlight_surface, INITIAL_SQUARE_SIZE)
-        screen.blit(highlight_surface, board_origin)
-
-        # Draw pieces at the calculated board_origin
-        draw_pieces(screen.subsurface((board_origin[0], board_origin[1], board_size, board_size)), board, INITIAL_SQUARE_SIZE, animating, animation_piece, animation_start_pos, animation_end_pos)
-
-        draw_info_panel(screen, game_over_text, is_player_move, info_panel_rect, info_panel_rect2, last_player_move if 'last_player_move' in locals() else None)
-
-        if promotion_move and is_player_move and not animating:
-            draw_promotion_panel(screen, board_origin, INITIAL_SQUARE_SIZE)
-
-        # Draw buttons
-        create_button(screen, "Restart", restart_button_rect, BUTTON_COLOR, BUTTON_TEXT_COLOR, font)
-        create_button(screen, "Quit", quit_button_rect, (200, 50, 50), BUTTON_TEXT_COLOR, font)
-
-    pygame.display.flip()
-    clock.tick(FPS)
\ No newline at end of file
+if __name__ == "__main__":
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(message)s")
+    profiler.set_enabled(PROFILE_ON_START)
+    startup_start = time.perf_counter() # Until the menu is on screen; None afterwards
+    init_display()
+    # The menu comes up right away: the engine starts (and does its UCI handshake) in the
+    # background, and the piece images are only loaded when the first game is drawn.
+    game_journal = GameJournal()
+    resumed_game = load_journal() # Continued once the engine is ready and the menu is shown
+    engine_pool = EnginePool()
+    engine_pool.warm_up_async(on_done=lambda ready: pygame.event.post(pygame.event.Event(ENGINE_STATUS_EVENT, ready=ready)))
+    running = True
+    needs_redraw = True # Set whenever the screen content may have changed
+    pygame.event.set_blocked(pygame.MOUSEMOTION) # Nothing reacts to hover; don't wake up for it
+
+    while running:
+        # --- Event Handling ---
+        busy = is_busy()
+        events = wait_for_events(busy)
+        frame_start = time.perf_counter() # Frame time excludes waiting for events
+        for event in events:
+            needs_redraw = True # Clicks, window exposure etc. may all change what is shown
+            if event.type == pygame.QUIT:
+                quit_game()
+
+            if event.type == pygame.KEYDOWN:
+                if event.key == PROFILER_KEY:
+                    toggle_profiler()
+                elif event.key == PROFILE_EXPORT_KEY:
+                    profiler.export()
+
+            if event.type == ENGINE_STATUS_EVENT:
+                logger.info("Engine %s.", "ready" if event.ready else "could not be started")
+
+            if event.type == ENGINE_LEASE_EVENT:
+                handle_engine_lease(event.workers)
+
+            if event.type == DATABASE_QUERY_EVENT and database_browser:
+                database_browser.apply_result(event)
+
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                mark_full_redraw() # Window contents were lost; dirty rects are not enough
+
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                if event.button == 1: # Left click
+                    click_pos = event.pos
+
+                    if game_state == MENU:
+                        # Handle menu clicks
+                        for skill, rect in menu_buttons.items():
+                            if rect.collidepoint(click_pos):
+                                if skill == 'quit':
+                                    quit_game()
+                                elif skill == 'simul':
+                                    if engine_pool.is_ready():
+                                        request_engines(("simul",), min(SIMUL_ENGINES, SIMUL_BOARDS))
+                                    else:
+                                        logger.warning("Cannot start simul - Engine not loaded.")
+                                elif skill == 'database':
+                                    open_database_browser() # Needs no engine
+                                    game_state = DATABASE
+                                elif engine_pool.is_ready(): # Only start if an engine could be loaded
+                                    request_engines(("game", skill)) # The game starts once the engine is leased
+                                elif engine_pool.status() == "starting":
+                                    logger.info("Engine is still starting, try again in a moment.")
+                                else:
+                                    logger.warning("Cannot start game - Engine not loaded.")
+                                break # Exit loop once a button is clicked
+
+                    elif game_state == PLAYING:
+                        board_origin, _, _, _, _, restart_button_rect, quit_button_rect, analysis_button_rect, menu_button_rect = get_playing_layout()
+
+                        # --- Handle PLAYING state clicks ---
+                        if session.promotion_move and session.is_player_move and not is_animating():
+                            promo_buttons_data = draw_promotion_panel(screen, board_origin, INITIAL_SQUARE_SIZE)
+                            promotion_choice = get_promotion_choice(click_pos, promo_buttons_data)
+                            if promotion_choice:
+                                session.handle_promotion_click(promotion_choice)
+
+                        elif session.is_player_move and not session.game_over_text and not is_animating():
+                            clicked_square_name = get_square_from_pos(click_pos, INITIAL_SQUARE_SIZE, board_origin)
+                            if clicked_square_name:
+                                session.handle_board_click(clicked_square_name) # Moves are animated through on_move
+
+                        # Check button clicks
+                        if restart_button_rect.collidepoint(click_pos):
+                            session.restart_game()
+                            stop_animation()
+                            if analysis:
+                                analysis.start(session.board)
+                        elif quit_button_rect.collidepoint(click_pos):
+                            quit_game()
+                        elif analysis_button_rect.collidepoint(click_pos):
+                            toggle_analysis()
+                        elif menu_button_rect.collidepoint(click_pos):
+                            leave_game()
+
+                    elif game_state == SIMUL:
+                        menu_button_rect, quit_button_rect = get_simul_button_rects()
+                        if menu_button_rect.collidepoint(click_pos):
+                            stop_simul()
+                            game_state = MENU
+                        elif quit_button_rect.collidepoint(click_pos):
+                            quit_game()
+                        else:
+                            handle_simul_click(click_pos)
+
+                    elif game_state == DATABASE:
+                        back_button_rect, reset_button_rect, menu_button_rect, quit_button_rect = get_database_button_rects()
+                        if back_button_rect.collidepoint(click_pos):
+                            database_browser.back()
+                        elif reset_button_rect.collidepoint(click_pos):
+                            database_browser.reset()
+                        elif menu_button_rect.collidepoint(click_pos):
+                            game_state = MENU
+                        elif quit_button_rect.collidepoint(click_pos):
+                            quit_game()
+                        else:
+                            handle_database_click(click_pos)
+
+        profiler.record("events", frame_start)
+
+        # --- Game Logic ---
+        logic_start = time.perf_counter()
+        if game_state == MENU:
+            resume_pending_game()
+        elif game_state == PLAYING:
+            if is_animating() and update_tweens():
+                needs_redraw = True # Draw the pieces at rest on their destinations
+
+            if not is_animating() and session.is_engine_turn():
+                if session.engine_searching:
+                    if session.poll_engine_move():
+                        needs_redraw = True
+                else:
+                    with profiler.span("make_engine_move"):
+                        session.make_engine_move()
+        elif game_state == SIMUL:
+            if update_simul():
+                needs_redraw = True
+        profiler.record("logic", logic_start)
+
+        # --- Drawing ---
+        busy = is_busy()
+        if not (needs_redraw or busy or profiler_overlay_due()):
+            continue # Nothing changed since the last frame
+        needs_redraw = False
+        render_start = time.perf_counter()
+
+        if game_state == MENU:
+            screen.fill((200, 200, 200)) # Background color
+            draw_menu(screen)
+            pygame.display.flip()
+            if startup_start is not None:
+                logger.info("Menu shown %.0f ms after start.", (time.perf_counter() - startup_start) * 1000)
+                startup_start = None
+            mark_full_redraw() # The board has to be painted from scratch once a game starts
+        elif game_state == PLAYING:
+            layout = get_playing_layout()
+            dirty_rects = draw_playing_screen(screen, session, *layout)
+            if profiler.enabled and (dirty_rects is None or profiler_overlay_due()):
+                board_origin = layout[0]
+                overlay_rect = pygame.Rect(0, 0, screen_width, board_origin[1]) # Free strip above the board
+                draw_profiler_overlay(screen, overlay_rect, session)
+                if dirty_rects is not None:
+                    dirty_rects.append(overlay_rect)
+            if dirty_rects is None:
+                pygame.display.flip()
+            elif dirty_rects:
+                pygame.display.update(dirty_rects) # Push only the parts of the screen that changed
+        elif game_state == SIMUL:
+            dirty_rects = draw_simul_screen(screen, *get_simul_button_rects())
+            if dirty_rects is None:
+                pygame.display.flip()
+            elif dirty_rects:
+                pygame.display.update(dirty_rects)
+        elif game_state == DATABASE:
+            draw_database_screen(screen, database_browser)
+            pygame.display.flip()
+            mark_full_redraw() # Drawn over whatever the game screens remember
+        profiler.record("render", render_start)
+        profiler.record("frame", frame_start)
+        profiler.mark_frame()
+
+        if busy:
+            clock.tick(FPS) # Cap the frame rate only while animating or waiting for the engine
+        else:
+            clock.tick() # Keep the clock's timing current without sleeping
@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+import chess
+
+from ChessGeneric import percentile
+from ChessServer import DEFAULT_PORT
+
+# Simulates many clients playing against a running ChessServer at once. Every session opens its
+# own connection, starts a game and plays random legal moves; the time from sending a move to
+# receiving the engine's reply is measured. Prints moves per second and latency percentiles.
+#
+# Example: python ChessServer.py --engines 4 --move-time 0.05 &
+#          python ChessLoadTest.py --sessions 300 --moves 20
+
+# --- Constants ---
+DEFAULT_SESSIONS = 100
+DEFAULT_MOVES = 20 # Player moves per session (fewer if the game ends first)
+DEFAULT_SKILL = 1
+
+class SessionError(Exception):
+    pass
+
+async def run_session(session_number, host, port, skill, moves, latencies, ramp):
+    # Plays one game; returns the number of moves answered
+    await asyncio.sleep(ramp * random.random()) # Spread the connects instead of all at once
+    reader, writer = await asyncio.open_connection(host, port)
+    rng = random.Random(session_number) # Same moves on every run with the same server replies
+
+    async def request(message):
+        writer.write(json.dumps(message).encode() + b"\n")
+        await writer.drain()
+        line = await reader.readline()
+        if not line:
+            raise SessionError("Server closed the connection")
+        reply = json.loads(line)
+        if reply.get("type") == "error":
+            raise SessionError(reply.get("message"))
+        return reply
+
+    played = 0
+    try:
+        state = await request({"cmd": "new", "skill": skill})
+        while played < moves and state["result"] is None:
+            move = rng.choice(list(chess.Board(state["fen"]).legal_moves))
+            start = time.perf_counter()
+            state = await request({"cmd": "move", "game": state["game"], "move": move.uci()})
+            latencies.append(time.perf_counter() - start)
+            played += 1
+    finally:
+        writer.close()
+    return played
+
+async def run_load_test(host, port, sessions, moves, skill, ramp):
+    latencies = []
+    start_time = time.perf_counter()
+    results = await asyncio.gather(*(run_session(i, host, port, skill, moves, latencies, ramp) for i in range(sessions)), return_exceptions=True)
+    elapsed = time.perf_counter() - start_time
+
+    errors = [result for result in results if isinstance(result, Exception)]
+    print(f"{sessions} sessions, {len(latencies)} moves in {elapsed:.1f}s: {len(latencies) / elapsed:.1f} moves/s")
+    if latencies:
+        ordered = sorted(latencies)
+        print("Move latency (ms): " + "  ".join(f"p{pct} {percentile(ordered, pct) * 1000:.0f}" for pct in (50, 90, 99))
+              + f"  max {ordered[-1] * 1000:.0f}  mean {sum(ordered) / len(ordered) * 1000:.0f}")
+    if errors:
+        print(f"{len(errors)} sessions failed, e.g.: {errors[0]!r}")
+    return len(errors)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test a running ChessServer with many simulated clients.")
+    parser.add_argument("--host", default="127.0.0.1", help="server address (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="server port (default: %(default)s)")
+    parser.add_argument("--sessions", type=int, default=DEFAULT_SESSIONS, help="clients playing at the same time")
+    parser.add_argument("--moves", type=int, default=DEFAULT_MOVES, help="moves each client plays")
+    parser.add_argument("--skill", type=int, default=DEFAULT_SKILL, help="engine skill level of the games")
+    parser.add_argument("--ramp", type=float, default=1.0, help="seconds over which the clients connect (default: %(default)s)")
+    args = parser.parse_args(argv)
+    failed = asyncio.run(run_load_test(args.host, args.port, args.sessions, args.moves, args.skill, args.ramp))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
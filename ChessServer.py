@@ -0,0 +1,358 @@
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import logging
+import sys
+
+import chess
+import chess.engine
+
+from ChessGeneric import ENGINE_PATH, LOG_LEVEL, TIME_PROFILES, format_score, get_changed_options, get_engine_options, get_move_limit
+
+# Hosts games against the engine for clients on the LAN. Clients connect over TCP and send one
+# JSON object per line; every answer is one JSON object per line as well. Requests may carry an
+# "id", which is copied into the answers to them. Games belong to the connection that started them.
+#
+#   {"cmd": "new", "skill": 8, "color": "white"}     -> state (after the engine's first move if you play black)
+#   {"cmd": "move", "game": 1, "move": "e2e4"}       -> state after the engine's reply (UCI or SAN)
+#   {"cmd": "resign", "game": 1}                     -> state with the result
+#   {"cmd": "state", "game": 1}                      -> state
+#   {"cmd": "evaluate", "game": 1, "time": 1.0}      -> eval lines as the search deepens, the last one has "final": true
+#   {"cmd": "stats"}                                 -> games, moves played, searches running and waiting
+#
+# Errors come back as {"type": "error", "message": ...}. Searches of all games share a few engine
+# processes; at most one search runs per engine and the others wait their turn.
+#
+# Example: python ChessServer.py --port 8765 --engines 4
+
+# --- Constants ---
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 8765
+DEFAULT_ENGINES = 2 # Engine processes, which is also the number of searches running at once
+MAX_GAMES = 1000 # Games open on the server at once, over all connections
+MAX_LINE_BYTES = 64 * 1024 # Longest request line accepted
+DEFAULT_EVAL_TIME = 1.0 # Seconds an evaluate request searches for
+MAX_EVAL_TIME = 10.0
+POOL_SKILL = max(TIME_PROFILES) # Engines are sized for the strongest level; games only change Skill Level
+
+logger = logging.getLogger("ChessServer")
+
+# --- Engine Pool ---
+class AsyncEnginePool:
+    """Async engines shared by every game on the server.
+
+    A search borrows an engine with `async with pool.engine()` for as long as it runs, so no
+    more than `size` searches run at once and the rest queue up. Threads and Hash are set once
+    per engine when it starts (cores and memory split between the engines); after that only
+    changed options are sent. An engine whose process died is replaced when it is handed back;
+    if that fails, an empty slot goes back instead and the next search to get it starts one.
+    """
+
+    def __init__(self, engine_path=ENGINE_PATH, size=DEFAULT_ENGINES):
+        self.engine_path = engine_path
+        self.size = size
+        self.idle = asyncio.Queue() # Engines not searching right now
+        self.engines = [] # Every running engine
+        self.configured_options = {} # engine -> options as last sent to it
+        self.waiting = 0 # Searches waiting for an engine
+        self.engine_options = get_engine_options(POOL_SKILL, size)
+
+    async def start_engine(self):
+        _, engine = await chess.engine.popen_uci(self.engine_path)
+        self.engines.append(engine)
+        self.configured_options[engine] = {}
+        await self.configure(engine, self.engine_options)
+        return engine
+
+    async def start(self):
+        for _ in range(self.size):
+            self.idle.put_nowait(await self.start_engine())
+        logger.info("%s engines started: %s (%s threads, %s MB hash each)", self.size, self.engine_path,
+                    self.engine_options["Threads"], self.engine_options["Hash"])
+
+    @contextlib.asynccontextmanager
+    async def engine(self):
+        self.waiting += 1
+        try:
+            engine = await self.idle.get()
+        finally:
+            self.waiting -= 1
+        try:
+            if engine is None:
+                engine = await self.start_engine() # An earlier restart failed; try again
+            yield engine
+        finally:
+            try:
+                if engine is not None and engine.returncode.done():
+                    logger.warning("Engine process died, starting a new one.")
+                    self.engines.remove(engine)
+                    del self.configured_options[engine]
+                    engine = None
+                    engine = await self.start_engine()
+            except (OSError, chess.engine.EngineError) as e:
+                logger.error("Could not restart the engine: %s", e)
+            finally:
+                self.idle.put_nowait(engine) # None if no engine could be started: the slot stays in the pool
+
+    def running(self):
+        return self.size - self.idle.qsize()
+
+    async def configure(self, engine, options):
+        configured = self.configured_options[engine]
+        changed = get_changed_options(engine, configured, options)
+        if changed:
+            await engine.configure(changed)
+            configured.update(changed)
+
+    async def close(self):
+        for engine in self.engines:
+            try:
+                await engine.quit()
+            except chess.engine.EngineError:
+                pass # Already gone
+        self.engines.clear()
+
+# --- Games ---
+class ServerGame:
+    def __init__(self, game_id, skill, player_color):
+        self.game_id = game_id
+        self.skill = skill
+        self.player_color = player_color
+        self.board = chess.Board()
+        self.result = None # "1-0", "0-1" or "1/2-1/2" once the game is over
+        self.termination = None # e.g. "checkmate", "resignation"
+        self.lock = asyncio.Lock() # Requests for one game are handled one after the other
+
+    def update_result(self):
+        outcome = self.board.outcome() # Automatic draws only (fivefold, 75 moves), as in the game
+        if outcome:
+            self.result = outcome.result()
+            self.termination = outcome.termination.name.lower()
+
+    def state(self):
+        return {
+            "type": "state",
+            "game": self.game_id,
+            "fen": self.board.fen(),
+            "turn": "white" if self.board.turn == chess.WHITE else "black",
+            "last_move": self.board.peek().uci() if self.board.move_stack else None,
+            "ply": self.board.ply(),
+            "result": self.result,
+            "termination": self.termination,
+        }
+
+class RequestError(Exception):
+    pass # Bad request; sent back to the client as an error line
+
+# --- Server ---
+class ChessServer:
+    def __init__(self, pool, move_time=None):
+        self.pool = pool
+        self.move_time = move_time # Fixed seconds per engine move instead of the game's time profiles
+        self.games = {} # game id -> ServerGame
+        self.game_ids = itertools.count(1)
+        self.moves_played = 0
+
+    async def handle_client(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        logger.info("Client connected: %s", peer)
+        client_games = set() # Game ids started on this connection
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    await self.send(writer, {"type": "error", "message": f"Request longer than {MAX_LINE_BYTES} bytes"})
+                    break
+                if not line:
+                    break # Client closed the connection
+                # Every request runs as its own task: one client can play several games at once
+                task = asyncio.create_task(self.handle_request(line, writer, client_games))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except ConnectionError:
+            for task in tasks:
+                task.cancel() # Nobody left to answer
+        finally:
+            await asyncio.gather(*tasks, return_exceptions=True) # Requests sent before the client hung up are still answered
+            for game_id in client_games:
+                self.games.pop(game_id, None)
+            writer.close()
+            logger.info("Client disconnected: %s (%s games closed)", peer, len(client_games))
+
+    async def send(self, writer, message):
+        if writer.is_closing():
+            return
+        writer.write(json.dumps(message).encode() + b"\n")
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass # Client is gone; handle_client cleans up
+
+    async def handle_request(self, line, writer, client_games):
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                raise RequestError("Request is not valid JSON")
+            if not isinstance(request, dict):
+                raise RequestError("Request must be a JSON object")
+            request_id = request.get("id")
+            async for message in self.dispatch(request, client_games):
+                if request_id is not None:
+                    message["id"] = request_id
+                await self.send(writer, message)
+        except RequestError as e:
+            await self.send(writer, {"type": "error", "message": str(e), "id": request_id})
+        except chess.engine.EngineError as e:
+            logger.error("Engine error: %s", e)
+            await self.send(writer, {"type": "error", "message": "Engine error", "id": request_id})
+        except Exception as e:
+            logger.exception("Error handling request: %s", e)
+            await self.send(writer, {"type": "error", "message": "Internal error", "id": request_id})
+
+    def get_game(self, request, client_games):
+        game_id = request.get("game")
+        if game_id not in client_games or game_id not in self.games:
+            raise RequestError(f"No game {game_id} on this connection")
+        return self.games[game_id]
+
+    async def dispatch(self, request, client_games):
+        # Yields the answers to one request
+        command = request.get("cmd")
+        if command == "new":
+            yield await self.new_game(request, client_games)
+        elif command == "move":
+            yield await self.play_move(self.get_game(request, client_games), request.get("move"))
+        elif command == "resign":
+            game = self.get_game(request, client_games)
+            async with game.lock:
+                if game.result is None:
+                    game.result = "0-1" if game.player_color == chess.WHITE else "1-0"
+                    game.termination = "resignation"
+                yield game.state()
+        elif command == "state":
+            yield self.get_game(request, client_games).state()
+        elif command == "evaluate":
+            async for message in self.evaluate(self.get_game(request, client_games), request.get("time", DEFAULT_EVAL_TIME)):
+                yield message
+        elif command == "stats":
+            yield {"type": "stats", "games": len(self.games), "moves_played": self.moves_played,
+                   "searches_running": self.pool.running(), "searches_waiting": self.pool.waiting}
+        else:
+            raise RequestError(f"Unknown command {command!r}")
+
+    async def new_game(self, request, client_games):
+        skill = request.get("skill", 8)
+        if not isinstance(skill, int) or isinstance(skill, bool) or skill not in TIME_PROFILES:
+            raise RequestError(f"Skill must be one of {list(TIME_PROFILES)}")
+        color = request.get("color", "white")
+        if color not in ("white", "black"):
+            raise RequestError("Color must be 'white' or 'black'")
+        if len(self.games) >= MAX_GAMES:
+            raise RequestError("Server is full")
+        game = ServerGame(next(self.game_ids), skill, chess.WHITE if color == "white" else chess.BLACK)
+        self.games[game.game_id] = game
+        client_games.add(game.game_id)
+        logger.debug("Game %s started (skill %s, client plays %s).", game.game_id, skill, color)
+        async with game.lock:
+            if game.player_color == chess.BLACK:
+                await self.play_engine_move(game)
+            return game.state()
+
+    async def play_move(self, game, move_text):
+        async with game.lock:
+            if game.result is not None:
+                raise RequestError("Game is over")
+            if game.board.turn != game.player_color:
+                raise RequestError("Not your move") # Only possible if an engine move failed earlier
+            try:
+                move = game.board.parse_uci(move_text)
+            except (ValueError, TypeError):
+                try:
+                    move = game.board.parse_san(move_text)
+                except (ValueError, TypeError):
+                    raise RequestError(f"Illegal move {move_text!r}")
+            if not move or move not in game.board.legal_moves: # "0000" and "--" parse as the null move
+                raise RequestError(f"Illegal move {move_text!r}")
+            game.board.push(move)
+            game.update_result()
+            if game.result is None:
+                await self.play_engine_move(game)
+            return game.state()
+
+    async def play_engine_move(self, game):
+        if self.move_time is not None:
+            limit = chess.engine.Limit(time=self.move_time)
+        else:
+            limit = get_move_limit(game.board, game.skill) # Same per-move limits as the local game
+        async with self.pool.engine() as engine:
+            await self.pool.configure(engine, {"Skill Level": game.skill})
+            result = await engine.play(game.board, limit) # No ucinewgame between games: the hash is shared
+        if result.move is None:
+            game.result = "1-0" if game.player_color == chess.WHITE else "0-1"
+            game.termination = "resignation"
+            return
+        game.board.push(result.move)
+        game.update_result()
+        self.moves_played += 1
+
+    async def evaluate(self, game, seconds):
+        if not isinstance(seconds, (int, float)) or not 0 < seconds <= MAX_EVAL_TIME:
+            raise RequestError(f"Time must be more than 0 and at most {MAX_EVAL_TIME} seconds")
+        async with game.lock:
+            board = game.board.copy()
+        if board.is_game_over():
+            raise RequestError("Game is over")
+        async with self.pool.engine() as engine:
+            await self.pool.configure(engine, {"Skill Level": game.skill})
+            last_depth = None
+            message = None
+            with await engine.analysis(board, chess.engine.Limit(time=seconds)) as analysis:
+                async for info in analysis:
+                    if "score" not in info or "pv" not in info or info.get("depth") == last_depth:
+                        continue # One line per depth is enough for a live display
+                    last_depth = info.get("depth")
+                    message = {"type": "eval", "game": game.game_id, "depth": last_depth, "score": format_score(info["score"]),
+                               "pv": [move.uci() for move in info["pv"]], "final": False}
+                    yield message
+        final = dict(message or {"type": "eval", "game": game.game_id, "depth": None, "score": None, "pv": []})
+        final["final"] = True
+        yield final
+
+async def serve(host, port, engine_path, engines, move_time):
+    pool = AsyncEnginePool(engine_path, engines)
+    await pool.start()
+    server = ChessServer(pool, move_time)
+    try:
+        tcp_server = await asyncio.start_server(server.handle_client, host, port, limit=MAX_LINE_BYTES)
+        logger.info("Listening on %s:%s", host, port)
+        async with tcp_server:
+            await tcp_server.serve_forever()
+    finally:
+        await pool.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve games against the engine to LAN clients (JSON lines over TCP).")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="address to listen on (default: all interfaces)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port (default: %(default)s)")
+    parser.add_argument("--engines", type=int, default=DEFAULT_ENGINES, help="engine processes, i.e. searches running at once (default: %(default)s)")
+    parser.add_argument("--engine", default=ENGINE_PATH, help="path to the UCI engine")
+    parser.add_argument("--move-time", type=float, default=None, help="seconds per engine move (default: the game's per-skill time profiles)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(message)s")
+    try:
+        asyncio.run(serve(args.host, args.port, args.engine, args.engines, args.move_time))
+    except KeyboardInterrupt:
+        logger.info("Server stopped.")
+    except OSError as e:
+        logger.error("Could not start the server: %s", e)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
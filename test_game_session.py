@@ -0,0 +1,236 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from collections import OrderedDict
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy") # Drawing tests need a display, not a window
+
+import chess
+import chess.engine
+import chess.polyglot
+import pygame
+
+import ChessGeneric
+from ChessGeneric import GameJournal, GameSession, Tween, load_journal
+
+# Smoke tests for GameSession without a window or an engine process: clicks come in as square
+# names, and engine moves come from the shortcuts that need no search (forced moves, the opening
+# book, the position cache). Searches that would need Stockfish go to RecordingWorker.
+#
+# Run with: python -m unittest   (or python -m pytest)
+
+class RecordingWorker:
+    # Stands in for an EngineWorker; remembers what would have been searched
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, board, options, limit, results, game=None, on_info=None):
+        self.submitted.append(board.fen())
+        return len(self.submitted)
+
+    def cancel(self, search_id):
+        pass
+
+    def stop(self, search_id):
+        return False
+
+class RecordingJournal:
+    # Stands in for a GameJournal; remembers the results written
+    def __init__(self):
+        self.results = []
+
+    def start_game(self, skill):
+        pass
+
+    def record_move(self, move):
+        pass
+
+    def finish_game(self, board, skill, result):
+        self.results.append(result)
+
+def write_polyglot_book(path, entries):
+    # entries: [(board, move)] with weight 1 each; Polyglot wants them sorted by key
+    records = []
+    for board, move in entries:
+        raw_move = move.to_square | move.from_square << 6
+        records.append((chess.polyglot.zobrist_hash(board), raw_move))
+    with open(path, "wb") as f:
+        for key, raw_move in sorted(records):
+            f.write(struct.pack(">QHHI", key, raw_move, 1, 0))
+
+class GameSessionTest(unittest.TestCase):
+    def setUp(self):
+        # Keep the tests off the files next to the game (book, tablebases, cache, journal)
+        self.temp_dir = tempfile.mkdtemp()
+        self.saved = {name: getattr(ChessGeneric, name) for name in ("POSITION_CACHE_PATH", "position_cache", "position_cache_dirty", "opening_book", "opening_book_checked", "tablebase_checked")}
+        ChessGeneric.POSITION_CACHE_PATH = os.path.join(self.temp_dir, "positions.json")
+        ChessGeneric.position_cache = OrderedDict()
+        ChessGeneric.position_cache_dirty = False
+        ChessGeneric.opening_book = None
+        ChessGeneric.opening_book_checked = True # No book unless a test opens one
+        ChessGeneric.tablebase_checked = True # No tablebases
+        self.moves_seen = []
+        self.session = GameSession(engine_difficulty=8, on_move=lambda move, board_before: self.moves_seen.append(move), ponder=False)
+
+    def tearDown(self):
+        self.session.close()
+        ChessGeneric.save_position_cache() # Waits for a background write to the temp dir
+        if ChessGeneric.opening_book is not None:
+            ChessGeneric.opening_book.close()
+        for name, value in self.saved.items():
+            setattr(ChessGeneric, name, value)
+        shutil.rmtree(self.temp_dir)
+
+    def play_clicks(self, *square_names):
+        for square_name in square_names:
+            self.session.handle_board_click(square_name)
+
+    def test_player_move_by_clicks(self):
+        self.play_clicks("e2", "e4")
+        self.assertEqual(self.session.board.move_stack, [chess.Move.from_uci("e2e4")])
+        self.assertFalse(self.session.is_player_move)
+        self.assertEqual(self.moves_seen, [chess.Move.from_uci("e2e4")])
+        self.assertEqual(self.session.legal_move_count, 20) # Index rebuilt for Black
+
+    def test_illegal_and_opponent_clicks_do_not_move(self):
+        self.play_clicks("e7", "e2", "e5", "g1", "g1", "a3")
+        self.assertEqual(self.session.board.move_stack, [])
+        self.assertTrue(self.session.is_player_move)
+        self.assertIsNone(self.session.selected_square)
+
+    def test_promotion_choice(self):
+        self.session.board = chess.Board("8/P6k/8/8/8/8/8/K7 w - - 0 1")
+        self.session.build_move_index()
+        self.play_clicks("a7", "a8")
+        self.assertIsNotNone(self.session.promotion_move)
+        self.assertTrue(self.session.handle_promotion_click('n'))
+        self.assertEqual(self.session.board.peek(), chess.Move.from_uci("a7a8n"))
+
+    def test_checkmate_ends_game(self):
+        for uci in ("f2f3", "e7e5", "g2g4"):
+            self.session.push_move(chess.Move.from_uci(uci))
+        self.session.is_player_move = False
+        self.session.push_move(chess.Move.from_uci("d8h4"))
+        self.assertEqual(self.session.check_game_over(), "Checkmate! Black (AI) wins.")
+        self.assertTrue(self.session.is_game_over())
+        self.assertFalse(self.session.is_engine_turn())
+
+    def test_fivefold_repetition_ends_game(self):
+        for _ in range(4):
+            for uci in ("g1f3", "g8f6", "f3g1", "f6g8"):
+                self.session.push_move(chess.Move.from_uci(uci))
+        self.assertEqual(self.session.check_game_over(), "Draw: Fivefold repetition!")
+
+    def test_forced_move_needs_no_search(self):
+        worker = self.session.worker = RecordingWorker()
+        self.session.board = chess.Board("k7/7R/8/8/8/8/8/K7 b - - 0 1") # Only Kb8
+        legal = list(self.session.board.legal_moves)
+        self.session.build_move_index()
+        self.session.is_player_move = False
+        self.session.make_engine_move()
+        self.assertEqual(len(legal), 1)
+        self.assertEqual(self.session.board.peek(), legal[0])
+        self.assertEqual(worker.submitted, [])
+        self.assertTrue(self.session.is_player_move)
+
+    def test_book_move(self):
+        book_path = os.path.join(self.temp_dir, "book.bin")
+        after_e4 = chess.Board()
+        after_e4.push_uci("e2e4")
+        write_polyglot_book(book_path, [(after_e4, chess.Move.from_uci("c7c5"))])
+        ChessGeneric.OPENING_BOOK_PATH, saved_path = book_path, ChessGeneric.OPENING_BOOK_PATH
+        ChessGeneric.opening_book_checked = False
+        try:
+            worker = self.session.worker = RecordingWorker()
+            self.play_clicks("e2", "e4")
+            self.session.make_engine_move()
+        finally:
+            ChessGeneric.OPENING_BOOK_PATH = saved_path
+        self.assertEqual(self.session.board.peek(), chess.Move.from_uci("c7c5"))
+        self.assertEqual(worker.submitted, [])
+
+    def test_cached_move_and_search_fallback(self):
+        worker = self.session.worker = RecordingWorker()
+        self.play_clicks("d2", "d4")
+        ChessGeneric.store_cached_move(self.session.board, 8, chess.engine.PlayResult(chess.Move.from_uci("g8f6"), None))
+        self.session.make_engine_move()
+        self.assertEqual(self.session.board.peek(), chess.Move.from_uci("g8f6"))
+        self.assertEqual(worker.submitted, [])
+
+        # Not in the cache: the position goes to the engine
+        self.play_clicks("c2", "c4")
+        self.session.make_engine_move()
+        self.assertTrue(self.session.engine_searching)
+        self.assertEqual(worker.submitted, [self.session.board.fen()])
+
+    def test_engine_result_is_applied_and_cached(self):
+        self.session.worker = RecordingWorker()
+        self.play_clicks("e2", "e4")
+        self.session.make_engine_move()
+        reply = chess.engine.PlayResult(chess.Move.from_uci("e7e5"), None)
+        self.session.engine_results.put((self.session.engine_search_id, reply))
+        self.assertTrue(self.session.poll_engine_move())
+        self.assertEqual(self.session.board.peek(), chess.Move.from_uci("e7e5"))
+        board_before = self.session.board.copy()
+        board_before.pop()
+        self.assertIsNotNone(ChessGeneric.lookup_cached_move(board_before, 8))
+
+    def test_every_ending_finishes_the_journal(self):
+        journal = self.session.journal = RecordingJournal()
+        self.session.restart_game()
+        self.session.apply_engine_result(chess.engine.PlayResult(None, None, draw_offered=True))
+        self.assertEqual(self.session.game_over_text, "AI Offered Draw")
+        self.session.apply_engine_result(chess.engine.EngineTerminatedError("gone")) # Already finished: not written twice
+        self.assertEqual(journal.results, ["1/2-1/2"])
+
+        self.session.restart_game()
+        self.session.apply_engine_result(chess.engine.EngineTerminatedError("gone"))
+        self.assertEqual(self.session.game_over_text, "Engine Error - Game Over")
+        self.assertEqual(journal.results, ["1/2-1/2", "*"])
+
+class GameJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "journal.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_resume_drops_torn_last_line(self):
+        with open(self.path, "w") as f:
+            f.write("G 8 1700000000\ne2e4\ne7e5\ng1f") # The process died in the middle of a write
+        skill, moves = load_journal(self.path)
+        self.assertEqual(moves, [chess.Move.from_uci("e2e4"), chess.Move.from_uci("e7e5")])
+
+        journal = GameJournal(self.path, os.path.join(self.temp_dir, "archive.pgn"))
+        journal.resume_game(skill, moves)
+        journal.record_move(chess.Move.from_uci("g1f3"))
+        journal.close()
+        self.assertEqual(load_journal(self.path)[1], moves + [chess.Move.from_uci("g1f3")])
+
+class DrawTweensTest(unittest.TestCase):
+    def setUp(self):
+        ChessGeneric.init_display()
+        ChessGeneric.load_and_scale_images(ChessGeneric.INITIAL_SQUARE_SIZE)
+        self.size = ChessGeneric.INITIAL_SQUARE_SIZE
+
+    def tearDown(self):
+        ChessGeneric.tweens.clear()
+
+    def test_fade_keeps_cached_sprite_transparent(self):
+        sprite = ChessGeneric.get_piece_sprite("bp", (self.size, self.size))
+        tween = Tween(chess.Piece(chess.PAWN, chess.BLACK), None, (0, 0), (0, 0), duration=1.0, fade_out=True)
+        ChessGeneric.tweens.append(tween)
+        surface = pygame.Surface((self.size, self.size))
+        ChessGeneric.draw_tweens(surface, self.size, tween.start_time + 0.5) # Half faded
+        self.assertTrue(sprite.get_flags() & pygame.SRCALPHA)
+
+        # Drawn normally afterwards, the corner of the square still shows the background
+        surface.fill((255, 255, 255))
+        surface.blit(ChessGeneric.get_piece_sprite("bp", (self.size, self.size)), (0, 0))
+        self.assertEqual(surface.get_at((0, 0))[:3], (255, 255, 255))
+
+if __name__ == "__main__":
+    unittest.main()